@@ -3,37 +3,76 @@
 SteamTools (Niema Moshiri 2021)
 '''
 
-# error message
-def error(s):
-    print(s, file=stderr); exit(1)
-
 # imports
-from datetime import date, datetime
+from argparse import ArgumentParser
+from asyncio import IncompleteReadError, Queue, Semaphore, TimeoutError as AsyncTimeoutError, gather, get_running_loop, new_event_loop, open_connection, run_coroutine_threadsafe, sleep as async_sleep, wait_for, wrap_future
+from atexit import register as atexit_register
+from base64 import b64encode
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from csv import DictWriter
+from datetime import date, datetime, timezone
+from email.utils import parsedate_to_datetime
 from glob import glob
-from json import loads as jloads
-from os import getcwd, makedirs
-from os.path import abspath, expanduser, isfile, isdir
-from sys import argv, stderr, stdout
-from time import sleep
-from urllib.request import Request, urlopen
+from http.client import HTTPException, IncompleteRead, RemoteDisconnected, parse_headers
+from io import BytesIO
+from json import dumps as jdumps, loads as jloads
+from os import O_WRONLY, devnull, dup2, environ, getcwd, makedirs, open as os_open, remove, replace, utime
+from os.path import abspath, expanduser, getsize, isfile, isdir
+from random import uniform
+from shutil import get_terminal_size
+from socket import create_connection
+from sqlite3 import connect as sqlite3_connect
+from ssl import create_default_context
+from sys import argv, intern, stderr, stdout
+from threading import Lock, Thread, get_ident
+from time import monotonic, perf_counter, time
+from urllib.error import HTTPError
+from urllib.parse import unquote, urljoin, urlsplit, urlunsplit
+from urllib.request import getproxies, proxy_bypass
+from weakref import WeakKeyDictionary
 from xml.etree import ElementTree
-try:
-    from prompt_toolkit.formatted_text import HTML
-    from prompt_toolkit.shortcuts import input_dialog, message_dialog, radiolist_dialog
-except:
-    error("Unable to import 'prompt_toolkit'. Install via: 'pip install prompt_toolkit'")
-try:
-    from filedate import File
-except:
-    error("Unable to import 'filedate'. Install via: 'pip install filedate'")
+from zlib import MAX_WBITS, decompress, error as ZlibError
 
 # useful constants
 VERSION = '0.0.2'
-WINDOW_TITLE = HTML("<ansiblue>SteamTools v%s</ansiblue>" % VERSION)
-ERROR_TITLE = HTML("<ansired>ERROR</ansired>")
+WINDOW_TITLE = "<ansiblue>SteamTools v%s</ansiblue>" % VERSION
+ERROR_TITLE = "<ansired>ERROR</ansired>"
 LINE_WIDTH = 120
-NUM_SHARED_FILE_ATTEMPTS = 10
-REATTEMPT_DELAY = 0.5
+LIST_PAGE_SIZE = 20 # rows shown at once in list dialogs (fewer if the terminal is too short)
+RETRY_MAX_ATTEMPTS = 10
+RETRY_BASE_DELAY = 0.25 # seconds (doubles after every failed attempt, with random jitter)
+RETRY_MAX_DELAY = 30 # seconds
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+CIRCUIT_BREAKER_THRESHOLD = 20 # consecutive failed attempts before requests to a host fail fast
+CIRCUIT_BREAKER_COOLDOWN = 30 # seconds requests to the host wait before it gets another chance
+NUM_DOWNLOAD_JOBS = 8
+NUM_PAGE_JOBS = 8
+NUM_SHARED_FILE_JOBS = 8 # detail pages loaded at once when downloading (separate from image downloads, so slow transfers don't hold up metadata)
+NUM_WRITE_JOBS = 1
+PIPELINE_QUEUE_SIZE = 64 # shared files waiting between two download stages (bounds memory use)
+ARCHIVE_QUEUE_SIZE = 8 # downloaded images waiting (in memory) to be written into an archive
+NUM_DETAILS_JOBS = 8
+NUM_ACHIEVEMENT_JOBS = 8
+NUM_RECENTLY_UNLOCKED = 100
+STORE_API_RATE = 200 / 300 # requests per second (the store API throttles at roughly 200 requests per 5 minutes)
+STORE_API_BURST = 20
+NUM_BATCH_JOBS = 16
+BATCH_RATE = 10 # requests per second across all batch workers unless --rate is given (so many accounts at once don't get throttled by Steam)
+BATCH_BURST = 20
+MAX_CONNECTIONS_PER_HOST = 4 # at least (raised to the number of parallel downloads, since screenshots all come from one CDN host)
+HTTP_TIMEOUT = 30 # seconds
+HTTP_MAX_REDIRECTS = 10
+HTTP_READ_SIZE = 64 * 1024
+HTTP_REDIRECT_CODES = {301, 302, 303, 307, 308}
+DOWNLOAD_CHUNK_SIZE = 64 * 1024 # bytes
+DOWNLOAD_TEMP_SUFFIX = '.part'
+FILE_SIZE_UNITS = {'B':0, 'KB':1, 'MB':2, 'GB':3}
+MANIFEST_FILENAME = '.steamtools_manifest.json'
+PROFILE_PHASES = ['wait', 'connect', 'latency', 'body', 'backoff', 'parse', 'timestamps'] # wait = rate limit/connection slot, latency = until response headers
+PROFILE_LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10] # seconds (upper bounds of latency histogram buckets)
 URLLIB_HEADERS = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/35.0.1916.47 Safari/537.36'}
 
 # URL stuff
@@ -42,6 +81,30 @@ STEAM_APP_DETAILS_BASE_URL = "https://store.steampowered.com/api/appdetails?appi
 STEAM_SHARED_FILES_BASE_URL = "https://steamcommunity.com/sharedfiles/filedetails?id="
 STEAM_URL_SUFFIX_XML = "?xml=1"
 
+# HTTP response cache (time-to-live in seconds for each endpoint class)
+CACHE_ENABLED = True
+CACHE_REFRESH = False # if True, revalidate every cached response regardless of its age
+CACHE_PATH = "%s/SteamTools/http_cache.sqlite" % environ.get('XDG_CACHE_HOME', expanduser('~/.cache'))
+CACHE_MAX_SIZE = 256 * 1024 * 1024 # bytes
+CACHE_EVICT_BATCH_SIZE = 100 # least-recently-used responses looked at per query when the cache is too big
+CACHE_ACCESS_FLUSH_SIZE = 1000 # cache hits whose access times are kept in memory before they're written (they're also written with every new response and at exit)
+CACHE_TTL = {
+    'profile': 3600,
+    'games': 3600,
+    'stats': 3600,
+    'screenshots': 600,
+    'appdetails': 7 * 86400,
+    'sharedfile': 30 * 86400, # shared file detail pages essentially never change
+}
+
+# library database settings
+LIBRARY_DB_PATH = "%s/SteamTools/library.sqlite" % environ.get('XDG_DATA_HOME', expanduser('~/.local/share'))
+LIBRARY_DB_MAX_AGE = CACHE_TTL['appdetails'] # seconds before a game's stored details are reloaded
+LIBRARY_DB_TAG_KINDS = {'genre':'genres', 'category':'categories', 'developer':'developers', 'publisher':'publishers', 'language':'supported_languages'} # tag kind -> key in game details
+LIBRARY_DB_CONTROLLER_SUPPORT = ['full', 'partial', 'any']
+LIBRARY_DB_QUERY_CHUNK_SIZE = 500 # app IDs per query when looking up tags (SQLite limits the number of query parameters)
+LIBRARY_DB_RELEASE_DATE_FORMATS = [('%b %d, %Y', '%Y-%m-%d'), ('%d %b, %Y', '%Y-%m-%d'), ('%B %d, %Y', '%Y-%m-%d'), ('%d %B, %Y', '%Y-%m-%d'), ('%b %Y', '%Y-%m'), ('%B %Y', '%Y-%m'), ('%Y', '%Y')] # (Steam release date format, ISO 8601 format) pairs, e.g. 'Jan 1, 2020', '1 Jan, 2020', or 'Jan 2020'
+
 # messages
 TEXT_LOADING_USER_DATA = "Loading user data"
 TEXT_USER_PROMPT = "Please enter your Steam username:"
@@ -49,7 +112,22 @@ TEXT_NEW_DIR_PROMPT = "Enter new directory name:"
 TEXT_WELCOME = "Welcome to SteamTools! This simple tool aims to provide a user-friendly command-line interface for exploring a public Steam account.\n\nMade by Niema Moshiri (niemasd), 2021"
 TEXT_LOADING_SCREENSHOTS = "Loading screenshots from"
 TEXT_LOADING_PAGE = "Loading page"
+TEXT_LOADING_DETAILS = "Loading game details"
+TEXT_STORED_DETAILS = "Stored game details"
+TEXT_DOWNLOADED_SCREENSHOTS = "Downloaded screenshots"
+TEXT_SYNCING_SCREENSHOTS = "Syncing screenshots from"
+TEXT_NEW_SCREENSHOTS = "New screenshots"
+TEXT_ARCHIVING_SCREENSHOTS = "Archiving screenshots from"
+TEXT_ARCHIVED_SCREENSHOTS = "Archived screenshots"
+TEXT_SAVE_AS = "Save screenshots as:"
+TEXT_LOADING = "loading..."
+TEXT_NO_GAMES = "No games found"
+TEXT_FILTER = "Filter: "
+TEXT_NO_MATCHES = "No matches"
+TEXT_RECENTLY_UNLOCKED = "Recently Unlocked"
+TEXT_COMPLETION = "Completion by Game"
 ERROR_IMPORT_PROMPT_TOOLKIT = "Unable to import 'prompt_toolkit'. Install via: 'pip install prompt_toolkit'"
+WARNING_IMPORT_FILEDATE = "WARNING: Unable to import 'filedate', so file creation times won't be set (only modified/accessed times). Install via: 'pip install filedate'"
 ERROR_INVALID_USERNAME = "Please enter a valid Steam username"
 ERROR_PROFILE_NOT_FOUND = "Profile not found"
 ERROR_INVALID_GAME = "Invalid game"
@@ -57,9 +135,27 @@ ERROR_INVALID_GAMES_LIST_MODE = "Invalid games list mode"
 ERROR_LOAD_DATA_FAILED = "Failed to load data"
 ERROR_LOAD_GAMES_FAILED = "Failed to load game library"
 ERROR_LOAD_SCREENSHOTS_FAILED = "Failed to load screenshots"
+ERROR_LOAD_ACHIEVEMENTS_FAILED = "Failed to load achievements"
+ERROR_DOWNLOAD_SCREENSHOTS_FAILED = "Failed to download screenshots"
+ERROR_INVALID_NUM_JOBS = "Number of jobs must be at least 1"
+ERROR_INVALID_NUM_CONNECTIONS = "Number of connections per host must be at least 1"
 ERROR_FILE_EXISTS = "File exists"
+ERROR_FILE_SIZE_MISMATCH = "Downloaded file size doesn't match"
+ERROR_BLOCKING_IN_EVENT_LOOP = "Blocking SteamTools call made from inside its event loop (await the *_async method instead)"
 ERROR_PATH_EXISTS = "Path exists"
 ERROR_EMPTY_NAME = "Empty name"
+ERROR_INVALID_ARCHIVE_FORMAT = "Invalid archive format"
+
+# headless export (fields of each kind of record, in CSV column order)
+EXPORT_FORMATS = ['ndjson', 'csv']
+ARCHIVE_FORMATS = ['tar', 'zip']
+EXPORT_FIELDS = {
+    'library': ['appID', 'name', 'release_date', 'developers', 'publishers', 'price', 'genres', 'categories', 'controller_support', 'supported_languages', 'achievements'],
+    'achievements': ['appID', 'game', 'name', 'name_api', 'description', 'unlocked', 'unlock_time'],
+    'screenshots': ['appID', 'game', 'ID', 'url', 'image_url', 'posted', 'resolution', 'file_size'],
+}
+CSV_LIST_SEPARATOR = '; '
+BATCH_FIELDS = ['user', 'kind', 'steamID', 'steamID64', 'online_state', 'games', 'games_with_screenshots', 'appID', 'game', 'name', 'name_api', 'description', 'unlocked', 'unlock_time', 'ID', 'url', 'error']
 
 # clean an HTML string
 def clean_html(s):
@@ -67,13 +163,42 @@ def clean_html(s):
     s = s.replace('&', '&amp;')
     return s
 
-# message
+# message (progress messages go to stderr in headless mode so they don't mix with exported records)
+MESSAGE_STREAM = stdout
 def message(s='', end='\n'):
-    print(s, end=end); stdout.flush()
+    print(s, end=end, file=MESSAGE_STREAM); MESSAGE_STREAM.flush()
+
+# prompt_toolkit is only needed by the interactive app, so it's imported on first use (keeps startup fast and lets the rest be used without it)
+def import_prompt_toolkit():
+    try:
+        from prompt_toolkit import formatted_text, shortcuts
+    except:
+        error(ERROR_IMPORT_PROMPT_TOOLKIT)
+    return formatted_text, shortcuts
+def HTML(s):
+    return import_prompt_toolkit()[0].HTML(s)
+def input_dialog(**kwargs):
+    return import_prompt_toolkit()[1].input_dialog(**kwargs)
+def message_dialog(**kwargs):
+    return import_prompt_toolkit()[1].message_dialog(**kwargs)
+def radiolist_dialog(**kwargs):
+    return import_prompt_toolkit()[1].radiolist_dialog(**kwargs)
+
+# set the timestamps of a file (also its creation time if 'filedate' is installed, otherwise just modified/accessed times, with a warning the first time)
+FILEDATE_WARNED = False
+def set_file_dates(path, d):
+    global FILEDATE_WARNED
+    try:
+        from filedate import File
+    except ImportError:
+        if not FILEDATE_WARNED:
+            FILEDATE_WARNED = True; print(WARNING_IMPORT_FILEDATE, file=stderr)
+        ts = d.timestamp(); utime(path, (ts, ts)); return
+    File(path).set(created=d, modified=d, accessed=d)
 
 # message app
 def message_app(s):
-    message_dialog(title=WINDOW_TITLE, text=s).run()
+    message_dialog(title=HTML(WINDOW_TITLE), text=s).run()
 
 # error message
 def error(s, crash=True):
@@ -81,12 +206,16 @@ def error(s, crash=True):
     if crash:
         exit(1)
 
+# exit quietly once the reader of stdout is gone (e.g. 'SteamTools.py export ... | head'), pointing stdout at devnull so the flush at exit doesn't raise again
+def exit_broken_pipe():
+    dup2(os_open(devnull, O_WRONLY), stdout.fileno()); exit(1)
+
 # error message app
 def error_app(s, crash=True):
     try:
-        message_dialog(title=ERROR_TITLE, text=HTML(break_string("<ansired>ERROR:</ansired> %s" % s))).run()
+        message_dialog(title=HTML(ERROR_TITLE), text=HTML(break_string("<ansired>ERROR:</ansired> %s" % s))).run()
     except:
-        message_dialog(title=ERROR_TITLE, text=break_string("ERROR: %s" % s)).run()
+        message_dialog(title=HTML(ERROR_TITLE), text=break_string("ERROR: %s" % s)).run()
     if crash:
         exit(1)
 
@@ -126,6 +255,73 @@ def select_path_app(files=True, folders=True):
         else:
             curr_path = selection
 
+# scrollable list dialog with type-to-filter (used like radiolist_dialog, but only the visible rows are rendered, and filtering scans a lowercase name index built once)
+class ListDialog:
+    # constructor ('values' = (value, label) pairs, shown in the given order)
+    def __init__(self, title='', text='', values=None, page_size=LIST_PAGE_SIZE):
+        formatted_text = import_prompt_toolkit()[0]
+        self.title = title; self.text = text; self.values = list() if values is None else values; self.app = None
+        self.page_size = max(1, min(page_size, get_terminal_size((LINE_WIDTH, page_size + 10)).lines - 10))
+        self.names = [formatted_text.to_plain_text(label).lower() for _, label in self.values]
+        self.query = ''; self.matches = range(len(self.values)); self.selected = 0; self.top = 0
+
+    # filter the list (a longer query only needs to scan the current matches)
+    def filter(self, query):
+        query = query.lower()
+        if query == self.query:
+            return
+        candidates = self.matches if query.startswith(self.query) else range(len(self.values))
+        self.matches = [i for i in candidates if query in self.names[i]]; self.query = query; self.selected = 0; self.top = 0
+
+    # move the selection by 'offset' rows, scrolling the visible window along with it
+    def move(self, offset):
+        if len(self.matches) == 0:
+            return
+        self.selected = min(max(self.selected + offset, 0), len(self.matches) - 1)
+        if self.selected < self.top:
+            self.top = self.selected
+        elif self.selected >= self.top + self.page_size:
+            self.top = self.selected - self.page_size + 1
+
+    # formatted text of the visible rows (plus a position line)
+    def rows(self):
+        to_formatted_text = import_prompt_toolkit()[0].to_formatted_text
+        if len(self.matches) == 0:
+            return [('', TEXT_NO_MATCHES)]
+        fragments = list(); end = min(self.top + self.page_size, len(self.matches))
+        for row in range(self.top, end):
+            style = 'reverse' if row == self.selected else ''
+            fragments += [(style, '> ' if row == self.selected else '  ')] + [(style + ' ' + s, t) for s, t, *_ in to_formatted_text(self.values[self.matches[row]][1])] + [('', '\n')]
+        fragments.append(('italic', '%d-%d of %d' % (self.top + 1, end, len(self.matches))))
+        return fragments
+
+    # build the dialog (only done once, so it can be run again and again)
+    def build(self):
+        from prompt_toolkit.application import Application, get_app
+        from prompt_toolkit.key_binding import KeyBindings, merge_key_bindings
+        from prompt_toolkit.key_binding.bindings.focus import focus_next, focus_previous
+        from prompt_toolkit.key_binding.defaults import load_key_bindings
+        from prompt_toolkit.layout import FormattedTextControl, HSplit, Layout, Window
+        from prompt_toolkit.widgets import Button, Dialog, Label, TextArea
+        def ok_handler(*_):
+            get_app().exit(result=self.values[self.matches[self.selected]][0] if len(self.matches) != 0 else None); return True
+        query = TextArea(prompt=TEXT_FILTER, multiline=False, accept_handler=ok_handler)
+        query.buffer.on_text_changed += lambda buffer: self.filter(buffer.text)
+        body = [Label(text=self.text, dont_extend_height=True), query] if self.text else [query]
+        body.append(Window(FormattedTextControl(self.rows), height=self.page_size + 1))
+        dialog = Dialog(title=self.title, body=HSplit(body, padding=1), buttons=[Button(text="Ok", handler=ok_handler), Button(text="Cancel", handler=lambda: get_app().exit())], with_background=True)
+        bindings = KeyBindings()
+        bindings.add('tab')(focus_next); bindings.add('s-tab')(focus_previous)
+        for key, offset in [('up', -1), ('down', 1), ('pageup', -self.page_size), ('pagedown', self.page_size)]:
+            bindings.add(key)(lambda event, offset=offset: self.move(offset))
+        return Application(layout=Layout(dialog, focused_element=query), key_bindings=merge_key_bindings([load_key_bindings(), bindings]), mouse_support=True, full_screen=True)
+
+    # show the dialog and return the value of the selected row (or None if cancelled)
+    def run(self):
+        if self.app is None:
+            self.app = self.build()
+        return self.app.run()
+
 # break a long string into multiple lines
 def break_string(s, max_width=LINE_WIDTH):
     col = 0; text = ''
@@ -135,22 +331,1006 @@ def break_string(s, max_width=LINE_WIDTH):
         text += (word + ' '); col += (len(word) + 1)
     return text
 
-# apps
+# check whether a number of bytes matches a file size displayed by Steam (e.g. "1.234 MB"), allowing for rounding
+def matches_file_size(num_bytes, file_size):
+    parts = file_size.replace(',','').split()
+    if len(parts) != 2 or parts[1].upper() not in FILE_SIZE_UNITS:
+        return True # unknown format, so nothing to check against
+    try:
+        value = float(parts[0])
+    except ValueError:
+        return True
+    exponent = FILE_SIZE_UNITS[parts[1].upper()]; decimals = len(parts[0].split('.')[1]) if '.' in parts[0] else 0
+    tolerance = 0.5 * 10**-decimals + 1e-9
+    return any(abs(num_bytes/base**exponent - value) <= tolerance for base in (1000, 1024))
+
+# exception raised when data can't be loaded from Steam
+class LoadError(Exception):
+    pass
+
+# exception raised when Steam returns something that is probably a temporary hiccup (e.g. an empty page), so it's worth retrying
+class TransientError(LoadError):
+    pass
+
+# decode a (possibly gzip/deflate compressed) HTTP response body
+def decode_body(body, content_encoding):
+    if content_encoding == 'gzip':
+        return decompress(body, 16 + MAX_WBITS)
+    elif content_encoding == 'deflate':
+        try:
+            return decompress(body)
+        except ZlibError: # some servers send raw deflate data without the zlib header
+            return decompress(body, -MAX_WBITS)
+    return body
+
+# span of time spent in one phase of requests to an endpoint class (used as a context manager)
+class ProfileSpan:
+    __slots__ = ('profiler', 'endpoint', 'phase', 'start', 'num_bytes')
+
+    # constructor
+    def __init__(self, profiler, endpoint, phase):
+        self.profiler = profiler; self.endpoint = endpoint; self.phase = phase; self.num_bytes = 0
+
+    # start and end the span
+    def __enter__(self):
+        self.start = perf_counter(); return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add(self.endpoint, self.phase, self.start, perf_counter(), self.num_bytes)
+
+# span that doesn't record anything (used while profiling is disabled, so instrumentation costs next to nothing)
+class NullSpan:
+    __slots__ = ('num_bytes',)
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+NULL_SPAN = NullSpan()
+
+# ID of the traced request the current task is working on (or None outside of a request)
+TRACE_REQUEST_ID = ContextVar('TRACE_REQUEST_ID', default=None)
+
+# request whose spans (including retries) are traced as async events with one ID, so concurrent requests on the event loop thread get separate tracks
+class TraceRequest:
+    __slots__ = ('profiler', 'token')
+
+    # constructor
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    # start and end the request (a request made while another one is in progress, e.g. the fetch inside a retried page load, stays part of the outer one)
+    def __enter__(self):
+        self.token = None
+        if TRACE_REQUEST_ID.get() is None:
+            with self.profiler.lock:
+                self.profiler.num_traced_requests += 1; self.token = TRACE_REQUEST_ID.set(self.profiler.num_traced_requests)
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.token is not None:
+            TRACE_REQUEST_ID.reset(self.token)
+
+# instrumentation of requests per endpoint class: request count, bytes, latency histogram, retries, errors, and time spent in each phase
+class Profiler:
+    # constructor
+    def __init__(self):
+        self.enabled = False; self.trace = False; self.lock = Lock(); self.reset()
+
+    # clear everything recorded so far
+    def reset(self):
+        with self.lock:
+            self.start = perf_counter(); self.endpoints = dict(); self.events = list(); self.num_traced_requests = 0
+
+    # start recording (and keep every span as a trace event if 'trace' is True)
+    def enable(self, trace=False):
+        self.reset(); self.trace = trace; self.enabled = True
+
+    # get a span of time spent in 'phase' of requests to 'endpoint'
+    def span(self, endpoint, phase):
+        if not self.enabled:
+            return NULL_SPAN
+        return ProfileSpan(self, endpoint, phase)
+
+    # get a context manager grouping the spans of one request into one trace track
+    def request(self):
+        if not (self.enabled and self.trace):
+            return NULL_SPAN
+        return TraceRequest(self)
+
+    # get the stats of an endpoint class (caller must hold the lock)
+    def get_endpoint(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {'requests':0, 'retries':0, 'throttled':0, 'errors':0, 'bytes':0, 'latencies':list(), 'phases':{phase:0. for phase in PROFILE_PHASES}}
+        return self.endpoints[endpoint]
+
+    # record a finished span
+    def add(self, endpoint, phase, start, end, num_bytes=0):
+        with self.lock:
+            stats = self.get_endpoint(endpoint); stats['phases'][phase] += end - start; stats['bytes'] += num_bytes
+            if phase == 'latency':
+                stats['requests'] += 1; stats['latencies'].append(end - start)
+            if self.trace:
+                request_id = TRACE_REQUEST_ID.get(); args = {'bytes':num_bytes} if num_bytes != 0 else dict()
+                if request_id is None: # synchronous work outside of a request can't overlap anything else on its thread
+                    self.events.append({'name':phase, 'cat':endpoint, 'ph':'X', 'ts':(start - self.start) * 1000000, 'dur':(end - start) * 1000000, 'pid':1, 'tid':get_ident(), 'args':args})
+                else: # requests overlap on the event loop thread, so each one gets its own async track
+                    self.events.append({'name':phase, 'cat':endpoint, 'ph':'b', 'id':request_id, 'ts':(start - self.start) * 1000000, 'pid':1, 'tid':get_ident(), 'args':args})
+                    self.events.append({'name':phase, 'cat':endpoint, 'ph':'e', 'id':request_id, 'ts':(end - self.start) * 1000000, 'pid':1, 'tid':get_ident()})
+
+    # count an event ('retries', 'throttled', or 'errors') for an endpoint class
+    def count(self, endpoint, event):
+        if self.enabled:
+            with self.lock:
+                self.get_endpoint(endpoint)[event] += 1
+
+    # get a summary of everything recorded so far
+    def summary(self):
+        summary = dict()
+        with self.lock:
+            for endpoint, stats in sorted(self.endpoints.items()):
+                latencies = sorted(stats['latencies']); histogram = {'<=%gs' % bound:0 for bound in PROFILE_LATENCY_BUCKETS}; histogram['>%gs' % PROFILE_LATENCY_BUCKETS[-1]] = 0
+                for latency in latencies:
+                    histogram[next(('<=%gs' % bound for bound in PROFILE_LATENCY_BUCKETS if latency <= bound), '>%gs' % PROFILE_LATENCY_BUCKETS[-1])] += 1
+                summary[endpoint] = {k:v for k,v in stats.items() if k != 'latencies'}
+                summary[endpoint]['phases'] = dict(stats['phases']); summary[endpoint]['latency_histogram'] = histogram
+                summary[endpoint]['latency_p50'] = latencies[len(latencies)//2] if len(latencies) != 0 else None
+                summary[endpoint]['latency_p99'] = latencies[min(len(latencies)-1, int(0.99 * len(latencies)))] if len(latencies) != 0 else None
+        return summary
+
+    # print a summary table
+    def report(self, out=stderr):
+        print("\n%-12s %8s %8s %9s %7s %9s %9s %9s" % ('endpoint', 'requests', 'retries', 'throttled', 'errors', 'MB', 'p50 (ms)', 'p99 (ms)') + ''.join(' %11s' % ('%s (s)' % phase) for phase in PROFILE_PHASES), file=out)
+        for endpoint, stats in self.summary().items():
+            p50, p99 = [('%9.1f' % (stats[k] * 1000)) if stats[k] is not None else '%9s' % '-' for k in ['latency_p50', 'latency_p99']]
+            print("%-12s %8d %8d %9d %7d %9.2f %s %s" % (endpoint, stats['requests'], stats['retries'], stats['throttled'], stats['errors'], stats['bytes'] / 1000000, p50, p99) + ''.join(' %11.3f' % stats['phases'][phase] for phase in PROFILE_PHASES), file=out)
+        connections = HTTP_CLIENT.stats()
+        print("\nHTTP: %d requests, %d connections opened, %d reused" % (connections['requests'], connections['connections_opened'], connections['connections_reused']), file=out)
+
+    # write the summary as JSON
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            f.write(jdumps(self.summary(), indent=2))
+
+    # write trace events in Chrome's Trace Event Format (open in chrome://tracing or Perfetto)
+    def write_trace(self, path):
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w') as f:
+            f.write(jdumps({'traceEvents':events, 'displayTimeUnit':'ms'}))
+
+    # report everything at exit (as requested on the command line)
+    def finish(self, report=True, json_path=None, trace_path=None):
+        if report:
+            self.report()
+        if json_path is not None:
+            self.write_json(json_path)
+        if trace_path is not None:
+            self.write_trace(trace_path)
+
+# shared profiler
+PROFILER = Profiler()
+
+# event loop that runs all network I/O (in a background thread, so blocking callers in any thread share one set of connections)
+EVENT_LOOP = None; EVENT_LOOP_LOCK = Lock()
+def get_event_loop():
+    global EVENT_LOOP
+    with EVENT_LOOP_LOCK:
+        if EVENT_LOOP is None:
+            EVENT_LOOP = new_event_loop(); Thread(target=EVENT_LOOP.run_forever, name='SteamTools-io', daemon=True).start()
+        return EVENT_LOOP
+
+# schedule a coroutine on the shared event loop, returned as a concurrent.futures.Future
+def submit_async(coro):
+    return run_coroutine_threadsafe(coro, get_event_loop())
+
+# check if a future submitted with submit_async failed
+def future_failed(future):
+    return future.done() and (future.cancelled() or future.exception() is not None)
+
+# run a coroutine on the shared event loop and wait for its result (the blocking API is built on this)
+def run_async(coro):
+    loop = get_event_loop()
+    try:
+        running_loop = get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is loop: # blocking on the loop from inside the loop would deadlock
+        coro.close(); raise RuntimeError(ERROR_BLOCKING_IN_EVENT_LOOP)
+    return submit_async(coro).result()
+
+# response of the asynchronous HTTP client (the body is read with 'await response.read()', in pieces if 'amt' is given)
+class AsyncResponse:
+    # constructor
+    def __init__(self, reader, status, reason, headers, will_close, timeout):
+        self.reader = reader; self.status = status; self.reason = reason; self.headers = headers; self.will_close = will_close; self.timeout = timeout
+        self.chunked = 'chunked' in headers.get('Transfer-Encoding', '').lower(); self.chunk_left = 0
+        self.length = None if self.chunked or headers.get('Content-Length') is None else int(headers['Content-Length'])
+        if self.length is None and not self.chunked: # body ends when the server closes the connection
+            self.will_close = True
+        self.done = status in (204, 304) or 100 <= status < 200 or self.length == 0
+
+    # check whether the whole body has been read
+    def isclosed(self):
+        return self.done
+
+    # read a piece of the body with a timeout
+    async def read_piece(self, amt):
+        return await wait_for(self.reader.read(amt), self.timeout)
+
+    # read the body (or at most 'amt' bytes of it), returning b'' once it's done
+    async def read(self, amt=None):
+        if amt is None:
+            parts = list()
+            while True:
+                part = await self.read(HTTP_READ_SIZE)
+                if not part:
+                    return b''.join(parts)
+                parts.append(part)
+        if self.done:
+            return b''
+        if self.chunked:
+            if self.chunk_left == 0:
+                line = await wait_for(self.reader.readline(), self.timeout)
+                if not line:
+                    raise IncompleteRead(b'')
+                self.chunk_left = int(line.split(b';')[0].strip(), 16)
+                if self.chunk_left == 0: # last chunk, so skip trailers
+                    while (await wait_for(self.reader.readline(), self.timeout)) not in (b'\r\n', b'\n', b''):
+                        pass
+                    self.done = True; return b''
+            data = await self.read_piece(min(amt, self.chunk_left))
+            if not data:
+                raise IncompleteRead(b'')
+            self.chunk_left -= len(data)
+            if self.chunk_left == 0:
+                await wait_for(self.reader.readline(), self.timeout) # CRLF after the chunk
+            return data
+        data = await self.read_piece(amt if self.length is None else min(amt, self.length))
+        if not data: # connection closed (early, if the length is known)
+            self.done = True
+            if self.length is not None:
+                self.will_close = True
+            return b''
+        if self.length is not None:
+            self.length -= len(data); self.done = self.length == 0
+        return data
+
+# asynchronous HTTP/1.1 client with persistent per-host keep-alive connection pools (limited by a semaphore per host)
+class AsyncHTTPClient:
+    # constructor
+    def __init__(self, timeout=HTTP_TIMEOUT, max_connections_per_host=MAX_CONNECTIONS_PER_HOST, rate_limiter=None):
+        self.timeout = timeout; self.max_connections_per_host = max_connections_per_host; self.rate_limiter = rate_limiter # rate_limiter limits all requests
+        self.ssl_context = None # created with the first HTTPS connection (loading the CA certificates is slow)
+        self.lock = Lock(); self.pools = WeakKeyDictionary() # each event loop gets its own (idle connections, semaphores) pool, both keyed by (scheme, host) tuples
+        self.num_requests = 0; self.num_connections_opened = 0; self.num_connections_reused = 0
+        self.proxies = getproxies(); self.proxied = dict() # proxies from the http_proxy/https_proxy/no_proxy environment variables (like urllib), and the proxy of each (scheme, host) key
+
+    # get the proxy to use for a (scheme, host) key (as a split URL), or None to connect directly
+    def proxy(self, key):
+        if key not in self.proxied:
+            proxy = self.proxies.get(key[0])
+            self.proxied[key] = urlsplit(proxy if '://' in proxy else 'http://' + proxy) if proxy is not None and not proxy_bypass(urlsplit('//' + key[1]).hostname) else None
+        return self.proxied[key]
+
+    # get the header lines authenticating with a proxy (if its URL has credentials)
+    def proxy_headers(self, proxy):
+        if proxy.username is None:
+            return list()
+        return ['Proxy-Authorization: Basic %s' % b64encode(('%s:%s' % (unquote(proxy.username), unquote(proxy.password or ''))).encode()).decode()]
+
+    # open a blocking socket tunnelled to host:port through an HTTP proxy (via CONNECT, as http.client does)
+    def tunnel(self, proxy, host, port):
+        sock = create_connection((proxy.hostname, proxy.port or 80), self.timeout)
+        try:
+            sock.sendall(('\r\n'.join(['CONNECT %s:%d HTTP/1.1' % (host, port), 'Host: %s:%d' % (host, port)] + self.proxy_headers(proxy)) + '\r\n\r\n').encode('latin-1')); head = b''
+            while b'\r\n\r\n' not in head:
+                data = sock.recv(HTTP_READ_SIZE)
+                if len(data) == 0:
+                    raise RemoteDisconnected("Proxy closed connection without response")
+                head += data
+            status_line = head.split(b'\r\n', 1)[0].decode('latin-1')
+            if status_line.split()[1:2] != ['200']:
+                raise OSError("Tunnel connection failed: %s" % status_line)
+        except BaseException:
+            sock.close(); raise
+        return sock
+
+    # get the connection pool of the running event loop
+    def pool(self):
+        loop = get_running_loop()
+        with self.lock:
+            if loop not in self.pools:
+                self.pools[loop] = (dict(), dict())
+            return self.pools[loop]
+
+    # get the semaphore limiting concurrent connections to a host
+    def slot(self, key):
+        slots = self.pool()[1]
+        if key not in slots:
+            slots[key] = Semaphore(self.max_connections_per_host)
+        return slots[key]
+
+    # get a connection to a host (reusing an idle keep-alive connection if possible), returned as a ((reader, writer), reused) tuple
+    async def connect(self, key, reuse=True, endpoint='other'):
+        idle = self.pool()[0].get(key, [])
+        while reuse and len(idle) != 0:
+            conn = idle.pop()
+            if conn[0].at_eof() or conn[1].is_closing(): # the server closed it while it was idle
+                conn[1].close(); continue
+            with self.lock:
+                self.num_connections_reused += 1
+            return conn, True
+        with self.lock:
+            self.num_connections_opened += 1
+            if key[0] == 'https' and self.ssl_context is None:
+                self.ssl_context = create_default_context()
+        scheme, host = key; parts = urlsplit('//' + host); ssl_context = self.ssl_context if scheme == 'https' else None; proxy = self.proxy(key); port = parts.port or (443 if scheme == 'https' else 80)
+        with PROFILER.span(endpoint, 'connect'): # DNS, TCP, and TLS
+            if proxy is None:
+                conn = await wait_for(open_connection(parts.hostname, port, ssl=ssl_context, server_hostname=(parts.hostname if ssl_context is not None else None)), self.timeout)
+            elif scheme == 'https': # TLS to the host inside a CONNECT tunnel through the proxy
+                sock = await get_running_loop().run_in_executor(None, self.tunnel, proxy, parts.hostname, port)
+                conn = await wait_for(open_connection(sock=sock, ssl=ssl_context, server_hostname=parts.hostname), self.timeout)
+            else: # plain HTTP requests go to the proxy (with absolute URLs)
+                conn = await wait_for(open_connection(proxy.hostname, proxy.port or 80), self.timeout)
+        return conn, False
+
+    # send a GET request on a connection and read the response headers
+    async def exchange(self, conn, key, path, headers):
+        reader, writer = conn; proxy = self.proxy(key)
+        if proxy is not None and key[0] == 'http':
+            path = '%s://%s%s' % (key[0], key[1], path)
+        lines = ['GET %s HTTP/1.1' % path, 'Host: %s' % key[1]] + (self.proxy_headers(proxy) if proxy is not None and key[0] == 'http' else list()) + ['%s: %s' % (k, v) for k, v in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')); await wait_for(writer.drain(), self.timeout)
+        try:
+            head = await wait_for(reader.readuntil(b'\r\n\r\n'), self.timeout)
+        except IncompleteReadError:
+            raise RemoteDisconnected("Remote end closed connection without response")
+        status_line, _, header_lines = head.partition(b'\r\n')
+        version, status, reason = (status_line.decode('latin-1').split(None, 2) + [''])[:3]
+        response_headers = parse_headers(BytesIO(header_lines))
+        will_close = version == 'HTTP/1.0' or 'close' in response_headers.get('Connection', '').lower()
+        return AsyncResponse(reader, int(status), reason.strip(), response_headers, will_close, self.timeout)
+
+    # send a GET request and get its response, returned as a (connection, response) tuple
+    async def send(self, key, path, headers, endpoint='other'):
+        conn, reused = await self.connect(key, endpoint=endpoint)
+        try:
+            with PROFILER.span(endpoint, 'latency'):
+                return conn, await self.exchange(conn, key, path, headers)
+        except Exception:
+            conn[1].close()
+            if not reused:
+                raise
+        conn, _ = await self.connect(key, reuse=False, endpoint=endpoint) # the server closed the idle connection, so retry on a new one
+        try:
+            with PROFILER.span(endpoint, 'latency'):
+                return conn, await self.exchange(conn, key, path, headers)
+        except Exception:
+            conn[1].close(); raise
+
+    # finish with a response (its connection goes back into the pool if the response was fully read)
+    def release(self, key, conn, response):
+        if response.isclosed() and not response.will_close:
+            self.pool()[0].setdefault(key, list()).append(conn)
+        else:
+            conn[1].close()
+        self.slot(key).release()
+
+    # request a URL (following redirects), returned as a (key, connection, response) tuple that must be passed to release()
+    # ('endpoint' is the endpoint class the request is profiled under)
+    async def request(self, url, headers=None, endpoint='other'):
+        headers = dict(URLLIB_HEADERS, **(headers or dict()))
+        for _ in range(HTTP_MAX_REDIRECTS + 1):
+            parts = urlsplit(url); key = (parts.scheme, parts.netloc)
+            path = urlunsplit(('', '', parts.path or '/', parts.query, ''))
+            with PROFILER.span(endpoint, 'wait'):
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire()
+                await self.slot(key).acquire()
+            try:
+                conn, response = await self.send(key, path, headers, endpoint=endpoint)
+            except BaseException:
+                self.slot(key).release(); raise
+            with self.lock:
+                self.num_requests += 1
+            try:
+                if response.status in HTTP_REDIRECT_CODES and 'Location' in response.headers:
+                    url = urljoin(url, response.headers['Location']); await response.read()
+                elif response.status >= 300:
+                    body = await response.read()
+                    raise HTTPError(url, response.status, response.reason, response.headers, BytesIO(body))
+                else:
+                    return key, conn, response
+            except BaseException:
+                self.release(key, conn, response); raise
+            self.release(key, conn, response)
+        raise HTTPError(url, response.status, "Too many redirects", response.headers, None)
+
+    # open a URL as an async context manager yielding the (unread) response
+    @asynccontextmanager
+    async def open(self, url, headers=None, endpoint='other'):
+        key, conn, response = await self.request(url, headers=headers, endpoint=endpoint)
+        try:
+            yield response
+        finally:
+            self.release(key, conn, response)
+
+    # get the (decompressed) body of a URL, returned as a (body, headers) tuple
+    async def get(self, url, headers=None, endpoint='other'):
+        headers = dict(headers or dict()); headers['Accept-Encoding'] = 'gzip, deflate'
+        async with self.open(url, headers=headers, endpoint=endpoint) as response:
+            with PROFILER.span(endpoint, 'body') as span:
+                body = await response.read(); span.num_bytes = len(body)
+        return decode_body(body, response.headers.get('Content-Encoding')), response.headers
+
+    # get connection statistics
+    def stats(self):
+        with self.lock:
+            return {'requests':self.num_requests, 'connections_opened':self.num_connections_opened, 'connections_reused':self.num_connections_reused}
+
+# shared HTTP client
+HTTP_CLIENT = AsyncHTTPClient()
+
+# token bucket rate limiter (shared between threads and event loops)
+class RateLimiter:
+    # constructor
+    def __init__(self, rate, burst=1):
+        self.rate = rate; self.burst = burst; self.tokens = burst; self.updated = monotonic(); self.lock = Lock()
+
+    # take a token, returning how long to wait before the request is allowed
+    def reserve(self):
+        with self.lock:
+            now = monotonic(); self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate); self.updated = now
+            self.tokens -= 1; return -self.tokens / self.rate # tokens can go negative, which queues up later callers
+
+    # wait until a request is allowed
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await async_sleep(wait)
+
+# rate limiters for endpoint classes that are throttled by Steam (only requests that actually hit the network count)
+RATE_LIMITERS = {
+    'appdetails': RateLimiter(STORE_API_RATE, STORE_API_BURST),
+}
+
+# get the number of seconds a server asked us to wait in the Retry-After header of an HTTP error (or None if it didn't)
+def get_retry_after(e):
+    value = None if e.headers is None else e.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0., float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0., (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except Exception:
+        return None
+
+# retry policy for all requests: exponential backoff with jitter, Retry-After/HTTP 429 awareness, and a per-host circuit breaker
+class RetryPolicy:
+    # constructor
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.max_attempts = max_attempts; self.base_delay = base_delay; self.max_delay = max_delay
+        self.lock = Lock(); self.hosts = dict()
+
+    # check whether an exception is worth retrying
+    def is_retryable(self, e, transient_only=False):
+        if isinstance(e, TransientError):
+            return True
+        elif transient_only:
+            return False
+        elif isinstance(e, HTTPError):
+            return e.code in RETRY_STATUS_CODES
+        return isinstance(e, (OSError, HTTPException, EOFError, AsyncTimeoutError))
+
+    # get the state of a host (number of consecutive failures, time until which its circuit is open, and time until which it asked us to wait)
+    def get_host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = {'failures':0, 'open_until':0., 'wait_until':0.}
+        return self.hosts[host]
+
+    # await 'func(attempt)' (a coroutine function that makes one request to 'url'), retrying it according to this policy
+    # (if 'transient_only' is True, only TransientError is retried, e.g. because 'func' already retries its own requests)
+    # (while a host's circuit is open, attempts wait for it to close instead of failing, so a short outage doesn't fail every queued request)
+    async def call(self, endpoint, url, func, attempts=None, transient_only=False):
+        host = urlsplit(url).netloc
+        if attempts is None:
+            attempts = self.max_attempts
+        with PROFILER.request():
+            for attempt in range(attempts):
+                with self.lock:
+                    state = self.get_host(host); now = monotonic()
+                    wait = max(state['open_until'], state['wait_until']) - now
+                if wait > 0: # the host is failing or asked everyone to back off
+                    with PROFILER.span(endpoint, 'backoff'):
+                        await async_sleep(wait)
+                try:
+                    result = await func(attempt)
+                except Exception as e:
+                    retryable = self.is_retryable(e, transient_only)
+                    if not (isinstance(e, HTTPError) and e.code == 304):
+                        PROFILER.count(endpoint, 'errors')
+                    with self.lock:
+                        state = self.get_host(host)
+                        if not retryable and not isinstance(e, HTTPError): # a response that isn't retryable still means the host is up
+                            state['failures'] = 0
+                        if retryable and not isinstance(e, TransientError):
+                            state['failures'] += 1
+                            if state['failures'] >= CIRCUIT_BREAKER_THRESHOLD:
+                                state['open_until'] = monotonic() + CIRCUIT_BREAKER_COOLDOWN; state['failures'] = 0
+                        if not retryable or attempt == attempts - 1:
+                            raise
+                        delay = uniform(0, min(self.max_delay, self.base_delay * 2**attempt)); retry_after = get_retry_after(e) if isinstance(e, HTTPError) else None
+                        if retry_after is not None or (isinstance(e, HTTPError) and e.code == 429): # throttled, so make every request to this host wait
+                            delay = max(delay, min(self.max_delay, self.base_delay * 2**attempt) if retry_after is None else retry_after)
+                            state['wait_until'] = max(state['wait_until'], monotonic() + delay); PROFILER.count(endpoint, 'throttled')
+                    PROFILER.count(endpoint, 'retries')
+                    with PROFILER.span(endpoint, 'backoff'):
+                        await async_sleep(delay)
+                else:
+                    with self.lock:
+                        self.get_host(host)['failures'] = 0
+                    return result
+
+# shared retry policy
+RETRY_POLICY = RetryPolicy()
+
+# persistent on-disk cache of HTTP responses with size-bounded LRU eviction
+class ResponseCache:
+    # constructor
+    def __init__(self, path=CACHE_PATH, max_size=CACHE_MAX_SIZE):
+        makedirs('/'.join(path.split('/')[:-1]), exist_ok=True)
+        self.lock = Lock(); self.max_size = max_size; self.accessed = dict()
+        self.executor = ThreadPoolExecutor(max_workers=1) # SQLite calls of the event loop run here, in order
+        self.db = sqlite3_connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, body BLOB, etag TEXT, last_modified TEXT, fetched REAL, accessed REAL, size INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        atexit_register(self.flush)
+
+    # get a cached response as a (body, etag, last_modified, fetched) tuple (or None if not cached)
+    # (the access time is only kept in memory until the next flush, so hits don't write to disk)
+    def get(self, url):
+        with self.lock:
+            row = self.db.execute("SELECT body, etag, last_modified, fetched FROM responses WHERE url=?", (url,)).fetchone()
+            if row is not None:
+                self.accessed[url] = time()
+                if len(self.accessed) >= CACHE_ACCESS_FLUSH_SIZE:
+                    self.write_accessed(); self.db.commit()
+            return row
+
+    # write pending access times (caller must hold the lock and commit)
+    def write_accessed(self):
+        self.db.executemany("UPDATE responses SET accessed=? WHERE url=?", [(accessed, url) for url, accessed in self.accessed.items()]); self.accessed = dict()
+
+    # write pending access times to disk
+    def flush(self):
+        with self.lock:
+            if len(self.accessed) != 0:
+                self.write_accessed(); self.db.commit()
+
+    # add (or replace) a cached response, then evict least-recently-used responses if the cache is too big
+    def put(self, url, body, etag=None, last_modified=None):
+        with self.lock:
+            row = self.db.execute("SELECT size FROM responses WHERE url=?", (url,)).fetchone()
+            if row is not None:
+                self.size -= row[0]
+            now = time(); self.size += len(body); self.accessed.pop(url, None); self.write_accessed() # so eviction sees up-to-date access times
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)", (url, body, etag, last_modified, now, now, len(body)))
+            while self.size > self.max_size: # least-recently-used responses, a batch at a time (instead of reading the whole table)
+                rows = self.db.execute("SELECT url, size FROM responses ORDER BY accessed LIMIT ?", (CACHE_EVICT_BATCH_SIZE,)).fetchall()
+                if len(rows) == 0:
+                    break
+                for old_url, old_size in rows:
+                    if self.size <= self.max_size:
+                        break
+                    self.db.execute("DELETE FROM responses WHERE url=?", (old_url,)); self.size -= old_size
+            self.db.commit()
+
+    # mark a cached response as freshly fetched (e.g. after the server replied "304 Not Modified")
+    def touch(self, url):
+        with self.lock:
+            self.db.execute("UPDATE responses SET fetched=? WHERE url=?", (time(), url)); self.db.commit()
+
+    # remove all cached responses
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses"); self.db.commit(); self.size = 0; self.accessed = dict()
+
+# get the shared response cache (or None if caching is disabled)
+CACHE = None; CACHE_LOCK = Lock()
+def get_cache():
+    global CACHE
+    if not CACHE_ENABLED:
+        return None
+    with CACHE_LOCK:
+        if CACHE is None:
+            CACHE = ResponseCache()
+        return CACHE
+
+# fetch the body of a URL, going through the response cache ('endpoint' is a key of CACHE_TTL)
+async def fetch_async(url, endpoint, refresh=False):
+    cache = get_cache(); cached = None; headers = dict(); loop = get_running_loop() # cache calls go through the cache's executor, so disk I/O doesn't block the event loop
+    if cache is not None:
+        cached = await loop.run_in_executor(cache.executor, cache.get, url)
+        if cached is not None:
+            body, etag, last_modified, fetched = cached
+            if not (refresh or CACHE_REFRESH) and time() - fetched < CACHE_TTL[endpoint]:
+                return body
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+    async def attempt(_):
+        if endpoint in RATE_LIMITERS:
+            with PROFILER.span(endpoint, 'wait'):
+                await RATE_LIMITERS[endpoint].acquire()
+        return await HTTP_CLIENT.get(url, headers=headers, endpoint=endpoint)
+    try:
+        body, response_headers = await RETRY_POLICY.call(endpoint, url, attempt)
+    except HTTPError as e:
+        if e.code == 304 and cached is not None: # not modified, so the cached response is still valid
+            await loop.run_in_executor(cache.executor, cache.touch, url); return cached[0]
+        raise
+    if cache is not None:
+        await loop.run_in_executor(cache.executor, cache.put, url, body, response_headers.get('ETag'), response_headers.get('Last-Modified'))
+    return body
+
+# single-pass parser of Steam HTML pages
+# scan() jumps between markers with str.find instead of looping over every line in Python
+class PageParser:
+    # parse an entire page (bytes)
+    @classmethod
+    def parse(cls, page):
+        parser = cls(); parser.scan(page.decode()); return parser.result()
+
+# get the text between a start marker and an end marker in a string (or None if the start marker isn't there)
+def between(s, start, end):
+    i = s.find(start)
+    if i == -1:
+        return None
+    i += len(start); j = s.find(end, i)
+    return s[i:] if j == -1 else s[i:j]
+
+# get the (start, end) indices of the line of a text containing a given index
+def line_bounds(text, i):
+    end = text.find('\n', i)
+    return text.rfind('\n', 0, i) + 1, len(text) if end == -1 else end
+
+# parser of shared file detail pages (result is a dict with 'image_url' and the detail stats, e.g. 'Posted', 'Size', 'File Size')
+class SharedFileParser(PageParser):
+    MARKERS = ['letterbox=false', 'detailsStatsContainerLeft', 'detailsStatsContainerRight']
+
+    # constructor
+    def __init__(self):
+        self.image_url = None; self.stats_names = list(); self.stats_vals = list(); self.curr_stats = None
+
+    # parse the text of a page
+    def scan(self, text):
+        pos = 0; next_marker = dict()
+        while True:
+            if self.curr_stats is not None: # inside a detailsStatsContainer, so read stats until a closing </div> line
+                while pos < len(text) and self.curr_stats is not None:
+                    end = line_bounds(text, pos)[1]; l = text[pos:end]; ls = l.strip(); pos = end + 1
+                    if ls == '</div>':
+                        self.curr_stats = None
+                    elif ls != '':
+                        self.curr_stats.append(between(l, self.curr_marker, '</div>').strip())
+                if self.curr_stats is not None:
+                    return
+            for marker in self.MARKERS: # find the next occurrence of each marker (reusing earlier searches)
+                if next_marker.get(marker, len(text)) < pos or marker not in next_marker:
+                    i = text.find(marker, pos); next_marker[marker] = len(text) if i == -1 else i
+            i = min(next_marker.values())
+            if i == len(text):
+                return
+            start, end = line_bounds(text, i); l = text[start:end]; pos = end + 1
+            if 'letterbox=false' in l:
+                assert self.image_url is None, "Duplicate image"
+                self.image_url = between(l, 'href="', '"').strip()
+            elif 'detailsStatsContainerLeft' in l:
+                self.curr_stats = self.stats_names; self.curr_marker = '<div class="detailsStatLeft">'
+            else:
+                self.curr_stats = self.stats_vals; self.curr_marker = '<div class="detailsStatRight">'
+
+    # get the result
+    def result(self):
+        assert len(self.stats_names) == len(self.stats_vals), "Failed to parse detail stats"
+        data = dict() if self.image_url is None else {'image_url':self.image_url}
+        data.update(zip(self.stats_names, self.stats_vals))
+        return data
+
+# parser of screenshot grid pages (result is a (list of shared file IDs, total number of screenshots) tuple)
+class ScreenshotGridParser(PageParser):
+    # constructor
+    def __init__(self):
+        self.IDs = list(); self.total = None
+
+    # parse the text of a page
+    def scan(self, text):
+        find = text.find; pos = 0
+        while True:
+            i = find('filedetails', pos)
+            if i == -1:
+                break
+            start = text.rfind('\n', 0, i) + 1; end = find('\n', i)
+            if end == -1:
+                end = len(text)
+            j = find('?id=', start, end); pos = end + 1
+            if j != -1:
+                k = find('"', j, end); self.IDs.append(int(text[j+4:end if k == -1 else k]))
+        if self.total is None:
+            i = find('Showing ')
+            if i != -1:
+                start, end = line_bounds(text, i); self.total = int(between(text[start:end], ' of ', '<').replace(',',''))
+
+    # get the result
+    def result(self):
+        return self.IDs, self.total
+
+# parser of the user's screenshots page (result is the set of app IDs of games in the screenshot filter)
+class ScreenshotFilterParser(PageParser):
+    # constructor
+    def __init__(self):
+        self.app_ids = set()
+
+    # parse the text of a page
+    def scan(self, text):
+        find = text.find; pos = 0
+        while True:
+            i = find('javascript:SelectSharedFilesContentFilter', pos)
+            if i == -1:
+                break
+            start = text.rfind('\n', 0, i) + 1; end = find('\n', i)
+            if end == -1:
+                end = len(text)
+            j = find("'appid': '", start, end); pos = end + 1
+            if j != -1:
+                k = find("'", j+10, end); self.app_ids.add(text[j+10:end if k == -1 else k])
+
+    # get the result
+    def result(self):
+        return self.app_ids
+
+# pipeline that saves shared files into a folder in stages connected by bounded queues:
+# put() (list) -> detail pages ('detail_jobs' workers) -> image downloads ('image_jobs' workers) -> timestamps and 'callback(shared_file)' ('write_jobs' workers)
+# (used as "async with DownloadPipeline(...) as pipeline": leaving the block waits for all queued files, or cancels them if the block raised)
+# (if every stage has 1 job, files go through all stages one at a time, with no workers: the serial path)
+# (with an ArchiveWriter as 'archive', images are kept in memory instead of written to files, and written into the archive one at a time under folder 'destination' of the archive)
+class DownloadPipeline:
+    # constructor (job counts of None = current defaults)
+    def __init__(self, destination, image_jobs=None, detail_jobs=None, write_jobs=None, callback=None, queue_size=PIPELINE_QUEUE_SIZE, archive=None):
+        self.destination = destination; self.callback = callback; self.archive = archive
+        self.jobs = [NUM_SHARED_FILE_JOBS if detail_jobs is None else detail_jobs, NUM_DOWNLOAD_JOBS if image_jobs is None else image_jobs, NUM_WRITE_JOBS if write_jobs is None else write_jobs]
+        if min(self.jobs) < 1:
+            raise ValueError(ERROR_INVALID_NUM_JOBS)
+        queue_sizes = [queue_size, queue_size, queue_size]
+        if archive is not None: # an archive is written sequentially, and every image waiting for it is in memory
+            self.jobs[2] = 1; queue_sizes[2] = min(queue_size, ARCHIVE_QUEUE_SIZE)
+        self.queues = [Queue(size) for size in queue_sizes]; self.stages = [self.load_details, self.download, self.write]; self.workers = list(); self.serial = max(self.jobs) == 1
+        self.seen = set(); self.failed = list(); self.num_queued = 0; self.num_done = 0; self.num_bytes = 0; self.start_time = time()
+
+    # start the workers of every stage
+    async def __aenter__(self):
+        if self.serial:
+            return self
+        loop = get_running_loop()
+        self.workers = [[loop.create_task(self.work(i)) for _ in range(jobs)] for i, jobs in enumerate(self.jobs)]
+        return self
+
+    # wait for every stage to finish in order (or cancel them all if the block raised)
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                for queue, workers in zip(self.queues, self.workers):
+                    for _ in workers:
+                        await queue.put(None)
+                    await gather(*workers)
+        finally:
+            for task in [task for workers in self.workers for task in workers]:
+                task.cancel()
+            if self.num_done != 0:
+                message()
+
+    # queue a shared file (waits while the first stage is full; files that were already queued are skipped)
+    async def put(self, shared_file):
+        if shared_file.ID in self.seen:
+            return
+        self.seen.add(shared_file.ID); self.num_queued += 1
+        if not self.serial:
+            await self.queues[0].put(shared_file); return
+        item = (shared_file, None, None)
+        for i in range(len(self.stages)):
+            item = await self.run_stage(i, *item)
+            if item is None:
+                break
+
+    # run stage 'i' on a file (returns the input of the next stage, or None if it failed)
+    async def run_stage(self, i, shared_file, out_path, image):
+        try:
+            out_path, image = await self.stages[i](shared_file, out_path, image)
+        except Exception as e:
+            self.failed.append((shared_file, e)); self.finish_file(); return None
+        return shared_file, out_path, image
+
+    # worker of stage 'i' (passes each file on to the next stage, and stops at None)
+    async def work(self, i):
+        while True:
+            item = await self.queues[i].get()
+            if item is None:
+                return
+            item = await self.run_stage(i, *((item, None, None) if i == 0 else item))
+            if item is not None and i + 1 < len(self.queues):
+                await self.queues[i+1].put(item)
+
+    # stages (each returns the output path and the image, which is only kept in memory when writing an archive)
+    async def load_details(self, shared_file, out_path, image):
+        await shared_file.load_data_async()
+        return ("%s/%s" % (self.destination, shared_file.get_filename()) if self.destination else shared_file.get_filename()), None
+    async def download(self, shared_file, out_path, image):
+        if self.archive is None:
+            self.num_bytes += await shared_file.download_async(out_path)
+        else:
+            image = BytesIO(); self.num_bytes += await shared_file.fetch_image_async(image)
+        return out_path, image
+    async def write(self, shared_file, out_path, image): # file system and archive writes block, so they run on the event loop's executor
+        await get_running_loop().run_in_executor(None, self.write_file, shared_file, out_path, image)
+        if self.callback is not None:
+            self.callback(shared_file)
+        self.finish_file(); return out_path, None
+
+    def write_file(self, shared_file, out_path, image):
+        if self.archive is None:
+            with PROFILER.span('image', 'timestamps'):
+                set_file_dates(out_path, shared_file.data['Posted'])
+        else:
+            self.archive.add(out_path, image.getvalue(), shared_file.data['Posted'])
+
+    # count a finished (or failed) file and show progress
+    def finish_file(self):
+        self.num_done += 1; elapsed = max(time() - self.start_time, 1e-6)
+        message("%s: %d of %d (%.1f files/s, %.2f MB/s)" % (TEXT_DOWNLOADED_SCREENSHOTS, self.num_done, self.num_queued, self.num_done/elapsed, self.num_bytes/elapsed/1000000), end='\r')
+
+# download multiple shared files into a folder (or an archive) through a DownloadPipeline with 'jobs' parallel image downloads (returns list of (shared file, error) failures)
+# 'callback(shared_file)' is called (from the event loop thread) after each successful download
+def download_shared_files(shared_files, destination, jobs=None, callback=None, detail_jobs=None, write_jobs=None, archive=None):
+    return run_async(download_shared_files_async(shared_files, destination, jobs=jobs, callback=callback, detail_jobs=detail_jobs, write_jobs=write_jobs, archive=archive))
+async def download_shared_files_async(shared_files, destination, jobs=None, callback=None, detail_jobs=None, write_jobs=None, archive=None):
+    async with DownloadPipeline(destination, image_jobs=jobs, detail_jobs=detail_jobs, write_jobs=write_jobs, callback=callback, archive=archive) as pipeline:
+        for shared_file in shared_files:
+            await pipeline.put(shared_file)
+    return pipeline.failed
+
+# tar or zip archive that files are streamed into one after another, with their dates as modification times
+# (works on outputs that can't seek, like stdout, and needs no temporary files; 'tarfile'/'zipfile' are only imported when needed)
+class ArchiveWriter:
+    # constructor ('out' = binary file object)
+    def __init__(self, out, fmt=ARCHIVE_FORMATS[0]):
+        self.fmt = fmt
+        if fmt == 'tar':
+            from tarfile import open as tarfile_open
+            self.archive = tarfile_open(fileobj=out, mode='w|')
+        elif fmt == 'zip':
+            from zipfile import ZipFile, ZIP_STORED
+            self.archive = ZipFile(out, 'w', compression=ZIP_STORED) # images are already compressed
+        else:
+            raise ValueError("%s: %s" % (ERROR_INVALID_ARCHIVE_FORMAT, fmt))
+
+    # add a file with contents 'data' (bytes) and modification time 'd' (datetime)
+    def add(self, name, data, d):
+        if self.fmt == 'tar':
+            from tarfile import TarInfo
+            info = TarInfo(name); info.size = len(data); info.mtime = d.timestamp(); info.mode = 0o644
+            self.archive.addfile(info, BytesIO(data))
+        else:
+            from zipfile import ZipInfo
+            info = ZipInfo(name, date_time=d.timetuple()[:6]); info.external_attr = 0o644 << 16
+            self.archive.writestr(info, data)
+
+    # finish the archive (doesn't close the output)
+    def close(self):
+        self.archive.close()
+
+# manifest of the screenshots already downloaded into a folder (maps shared file ID to app ID, posted date, size, and filename)
+# (also keeps the IDs of failed downloads, and the app IDs whose last sync finished, so later syncs can retry failures and fill gaps)
+class Manifest:
+    # constructor
+    def __init__(self, folder):
+        self.folder = folder; self.path = "%s/%s" % (folder, MANIFEST_FILENAME)
+        self.entries = dict(); self.failed = dict(); self.complete = set()
+        if isfile(self.path):
+            with open(self.path) as f:
+                data = jloads(f.read())
+            self.entries = data['entries']; self.failed = data['failed']; self.complete = set(data['complete'])
+
+    # get the IDs of all shared files of a given game in this manifest
+    def get_ids(self, appID):
+        return {int(ID) for ID, entry in self.entries.items() if entry['appID'] == appID}
+
+    # get the IDs of the failed downloads of a given game
+    def get_failed_ids(self, appID):
+        return {int(ID) for ID, failed_appID in self.failed.items() if failed_appID == appID}
+
+    # add a downloaded shared file
+    def add(self, appID, shared_file):
+        filename = shared_file.get_filename()
+        self.entries[str(shared_file.ID)] = {'appID':appID, 'posted':shared_file.data['Posted'].isoformat(), 'size':getsize("%s/%s" % (self.folder, filename)), 'filename':filename}
+        self.failed.pop(str(shared_file.ID), None)
+
+    # add a shared file that failed to download (so the next sync retries it)
+    def add_failed(self, appID, shared_file):
+        self.failed[str(shared_file.ID)] = appID
+
+    # mark whether the last sync of a game finished (every listed file either downloaded or recorded as failed)
+    def set_complete(self, appID, complete):
+        if complete:
+            self.complete.add(appID)
+        else:
+            self.complete.discard(appID)
+
+    # save the manifest (atomically)
+    def save(self):
+        tmp_path = self.path + DOWNLOAD_TEMP_SUFFIX
+        with open(tmp_path, 'w') as f:
+            f.write(jdumps({'entries':self.entries, 'failed':self.failed, 'complete':sorted(self.complete)}, indent=1))
+        replace(tmp_path, self.path)
+
+    # length function
+    def __len__(self):
+        return len(self.entries)
+
+# apps (built when first run)
 APPS = {
-    'welcome': message_dialog(title=WINDOW_TITLE, text=TEXT_WELCOME),
-    'user_prompt': input_dialog(title=WINDOW_TITLE, text=TEXT_USER_PROMPT)
+    'welcome': lambda: message_dialog(title=HTML(WINDOW_TITLE), text=TEXT_WELCOME),
+    'user_prompt': lambda: input_dialog(title=HTML(WINDOW_TITLE), text=TEXT_USER_PROMPT),
 }
 
+# stream the elements with a given tag out of an XML document, clearing each one once the caller is done with it
+# (raises LoadError if the document is a Steam error or doesn't have a 'container' element)
+def iter_xml(xml, tag, container, error_message):
+    found_container = False
+    for _, elem in ElementTree.iterparse(BytesIO(xml)):
+        if elem.tag == tag:
+            yield elem; elem.clear()
+        elif elem.tag == container:
+            found_container = True; elem.clear()
+        elif elem.tag == 'error':
+            raise LoadError(elem.text.strip())
+    if not found_container:
+        raise LoadError(error_message)
+
+# split a URL into its (interned) folder and its filename, so URLs in the same folder share one copy of the folder
+def split_url(url):
+    i = url.rfind('/') + 1
+    return intern(url[:i]), url[i:]
+
+# parse a games list XML document into a sorted list of games
+def parse_games_xml(xml):
+    return sorted(Game(elem) for elem in iter_xml(xml, 'game', 'games', ERROR_LOAD_GAMES_FAILED))
+
+# parse a game stats XML document into a list of achievements
+def parse_achievements_xml(xml):
+    return [Achievement(elem) for elem in iter_xml(xml, 'achievement', 'achievements', ERROR_LOAD_ACHIEVEMENTS_FAILED)]
+
+# check if loading a game's achievements failed because the game doesn't have any (Steam serves an error, a non-XML page, or a 404 instead of a stats page)
+def is_missing_stats(e):
+    return isinstance(e, (LoadError, ElementTree.ParseError)) or (isinstance(e, HTTPError) and e.code == 404)
+
 # helper class to represent individual achievements
 class Achievement:
+    __slots__ = ('unlock_time', 'icon_unlocked_folder', 'icon_unlocked_filename', 'icon_locked_folder', 'icon_locked_filename', 'name', 'name_api', 'description')
+
     # constructor
     def __init__(self, achievement):
         self.unlock_time = None # None = still locked
         for curr in achievement:
             if curr.tag == 'iconClosed':
-                self.url_icon_unlocked = curr.text.strip()
+                self.icon_unlocked_folder, self.icon_unlocked_filename = split_url(curr.text.strip())
             elif curr.tag == 'iconOpen':
-                self.url_icon_locked = curr.text.strip()
+                self.icon_locked_folder, self.icon_locked_filename = split_url(curr.text.strip())
             elif curr.tag == 'name':
                 self.name = curr.text.strip()
             elif curr.tag == 'apiname':
@@ -160,6 +1340,14 @@ class Achievement:
             elif curr.tag == 'unlockTimestamp':
                 self.unlock_time = datetime.utcfromtimestamp(int(curr.text))
 
+    # icon URLs
+    @property
+    def url_icon_unlocked(self):
+        return self.icon_unlocked_folder + self.icon_unlocked_filename
+    @property
+    def url_icon_locked(self):
+        return self.icon_locked_folder + self.icon_locked_filename
+
     # view achievement details
     def view_details(self):
         if self.unlock_time is None:
@@ -169,12 +1357,24 @@ class Achievement:
         text += '\n\n%s' % break_string(self.description)
         message_dialog(title=HTML("<ansiblue>%s</ansiblue>" % self.name), text=HTML(text)).run()
 
+    # get a flat record of this achievement (for exporting)
+    def record(self):
+        return {
+            'name': self.name,
+            'name_api': getattr(self, 'name_api', None),
+            'description': getattr(self, 'description', None),
+            'unlocked': self.unlock_time is not None,
+            'unlock_time': None if self.unlock_time is None else self.unlock_time.isoformat(),
+        }
+
     # str function
     def __str__(self):
-        return str(self.__dict__)
+        return str({k:getattr(self, k) for k in self.__slots__ if hasattr(self, k)})
 
 # helper class to represent individual Steam Shared File
 class SharedFile:
+    __slots__ = ('ID', 'data')
+
     # constructor
     def __init__(self, ID):
         self.ID = ID
@@ -186,40 +1386,21 @@ class SharedFile:
 
     # load data
     def load_data(self, overwrite=False):
+        return run_async(self.load_data_async(overwrite=overwrite))
+    async def load_data_async(self, overwrite=False):
         if self.data is not None and not overwrite:
             return
-        self.data = dict(); url = self.get_url_details(); html_lines = None
-        for _ in range(NUM_SHARED_FILE_ATTEMPTS): # try multiple times (sometimes fails on first try)
-            try:
-                html_lines = urlopen(Request(url,headers=URLLIB_HEADERS)).read().decode().splitlines(); break
-            except:
-                sleep(REATTEMPT_DELAY)
-        if html_lines is None:
-            error_app(ERROR_LOAD_DATA_FAILED, crash=False); self.data = None; return
-        details_stats_names = list(); details_stats_vals = list()
-        for i, l in enumerate(html_lines):
-            if 'letterbox=false' in l:
-                assert 'image_url' not in self.data, "Duplace image: %s" % url
-                self.data['image_url'] = l.split('href="')[1].split('"')[0].strip()
-            elif 'detailsStatsContainerLeft' in l:
-                for j, jl in enumerate(html_lines[i+1:]):
-                    jls = jl.strip()
-                    if jls == '':
-                        continue
-                    elif jls == "</div>":
-                        break
-                    details_stats_names.append(jl.split('<div class="detailsStatLeft">')[1].split('</div>')[0].strip())
-            elif 'detailsStatsContainerRight' in l:
-                for j, jl in enumerate(html_lines[i+1:]):
-                    jls = jl.strip()
-                    if jls == '':
-                        continue
-                    elif jl.strip() == "</div>":
-                        break
-                    details_stats_vals.append(jl.split('<div class="detailsStatRight">')[1].split('</div>')[0].strip())
-        assert len(details_stats_names) == len(details_stats_vals), "Failed to parse detail stats: %s" % url
-        for i in range(len(details_stats_names)):
-            self.data[details_stats_names[i]] = details_stats_vals[i]
+        self.data = None; url = self.get_url_details()
+        try:
+            page = await fetch_async(url, 'sharedfile')
+        except Exception as e:
+            raise LoadError("%s: %s (%s)" % (ERROR_LOAD_DATA_FAILED, url, e))
+        try:
+            with PROFILER.span('sharedfile', 'parse'):
+                data = SharedFileParser.parse(page)
+        except AssertionError as e:
+            raise AssertionError("%s: %s" % (e, url))
+        self.data = data
         if 'Posted' in self.data:
             if ',' in self.data['Posted']: # has year
                 self.data['Posted'] = datetime.strptime(self.data['Posted'], '%b %d, %Y @ %I:%M%p')
@@ -228,27 +1409,101 @@ class SharedFile:
 
     # view file details
     def view_details(self):
-        self.load_data()
+        try:
+            self.load_data()
+        except LoadError as e:
+            error_app(str(e), crash=False); return
         text = "<ansired>- URL (Details):</ansired> %s" % self.get_url_details()
         text += "\n<ansired>- Posted:</ansired> %s" % self.data['Posted']
         text += "\n<ansired>- Resolution:</ansired> %s" % self.data['Size']
         text += "\n<ansired>- File Size:</ansired> %s" % self.data['File Size']
         message_dialog(title=HTML("<ansiblue>%s</ansiblue>" % self.ID), text=HTML(text)).run()
 
-    # download file
+    # download file (returns number of bytes written)
     def download(self, destination_path, overwrite=False):
-        if isfile(destination_path) and not overwrite:
-            error("%s: %s" % (ERROR_FILE_EXISTS, destination_path), crash=False)
-        else:
-            self.load_data(); data = None
-            for _ in range(NUM_SHARED_FILE_ATTEMPTS): # try multiple times (sometimes fails on first try)
-                try:
-                    data = urlopen(Request(self.data['image_url'],headers=URLLIB_HEADERS)).read(); break
-                except:
-                    sleep(REATTEMPT_DELAY)
-            if data is None:
-                error_app(ERROR_LOAD_DATA_FAILED)
-            f = open(destination_path, 'wb'); f.write(data); f.close()
+        return run_async(self.download_async(destination_path, overwrite=overwrite))
+    async def download_async(self, destination_path, overwrite=False):
+        loop = get_running_loop(); tmp_path = destination_path + DOWNLOAD_TEMP_SUFFIX # file system calls go through the executor (they can be slow, e.g. on network mounts)
+        if await loop.run_in_executor(None, isfile, destination_path) and not overwrite:
+            error("%s: %s" % (ERROR_FILE_EXISTS, destination_path), crash=False); return 0
+        def open_tmp(): # resume a transfer that was interrupted last time
+            f = open(tmp_path, 'r+b' if isfile(tmp_path) else 'wb'); f.seek(0, 2); return f
+        def finish(failed): # move the finished file into place, or keep it to resume from next time (unless it's empty)
+            f.close()
+            if not failed:
+                replace(tmp_path, destination_path)
+            elif getsize(tmp_path) == 0:
+                remove(tmp_path)
+        f = await loop.run_in_executor(None, open_tmp)
+        try:
+            num_bytes = await self.fetch_image_async(f, blocking=True)
+        except BaseException:
+            await loop.run_in_executor(None, finish, True); raise
+        await loop.run_in_executor(None, finish, False)
+        return num_bytes
+
+    # fetch the image into a binary file object, keeping what's already in it (returns number of bytes in the file object)
+    # (if 'blocking' is True, e.g. for files on disk, writes go through the executor so they don't hold up other requests)
+    async def fetch_image_async(self, f, blocking=False):
+        await self.load_data_async(); url = self.data['image_url']; loop = get_running_loop()
+        async def call(func, *args):
+            return (await loop.run_in_executor(None, func, *args)) if blocking else func(*args)
+        async def restart():
+            await call(f.seek, 0); await call(f.truncate)
+        async def attempt(_): # each attempt resumes an interrupted transfer where it stopped
+            offset = f.tell()
+            try:
+                async with HTTP_CLIENT.open(url, headers={'Range':'bytes=%d-' % offset} if offset != 0 else None, endpoint='image') as response:
+                    if response.status == 206: # partial content, so append to what we already have
+                        total_size = int(response.headers['Content-Range'].split('/')[1])
+                    else: # full content (the server might ignore the Range header)
+                        await restart(); total_size = response.headers.get('Content-Length')
+                    with PROFILER.span('image', 'body') as span:
+                        while True:
+                            chunk = await response.read(DOWNLOAD_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            await call(f.write, chunk); span.num_bytes += len(chunk)
+            except HTTPError as e:
+                if e.code == 416 and offset != 0: # requested range not satisfiable, so start over
+                    await restart(); raise TransientError("%s: %s" % (ERROR_LOAD_DATA_FAILED, url))
+                raise
+            if total_size is not None and f.tell() != int(total_size):
+                raise TransientError("%s: %s" % (ERROR_LOAD_DATA_FAILED, url))
+        try:
+            await RETRY_POLICY.call('image', url, attempt)
+        except Exception as e:
+            raise LoadError("%s: %s (%s)" % (ERROR_LOAD_DATA_FAILED, url, e))
+        num_bytes = f.tell()
+        if 'File Size' in self.data and not matches_file_size(num_bytes, self.data['File Size']):
+            await restart(); raise LoadError("%s (%d bytes vs. %s): %s" % (ERROR_FILE_SIZE_MISMATCH, num_bytes, self.data['File Size'], url))
+        return num_bytes
+
+    # get the filename this file is saved as (named by posted date)
+    def get_filename(self):
+        if self.data is None:
+            self.load_data()
+        return "%s_%s.jpg" % (str(self.data['Posted']).replace(':','-').replace(' ','_'), self.ID)
+
+    # download file into a folder and set its timestamps to the posted date (returns number of bytes written)
+    def save(self, destination, overwrite=False):
+        return run_async(self.save_async(destination, overwrite=overwrite))
+    async def save_async(self, destination, overwrite=False):
+        await self.load_data_async(); out_path = "%s/%s" % (destination, self.get_filename()); posted_date = self.data['Posted']
+        num_bytes = await self.download_async(out_path, overwrite=overwrite)
+        with PROFILER.span('image', 'timestamps'):
+            set_file_dates(out_path, posted_date)
+        return num_bytes
+
+    # get a flat record of this file (for exporting)
+    def record(self):
+        record = {'ID':self.ID, 'url':self.get_url_details()}
+        if self.data is not None:
+            record['image_url'] = self.data.get('image_url')
+            record['posted'] = self.data['Posted'].isoformat() if 'Posted' in self.data else None
+            record['resolution'] = self.data.get('Size')
+            record['file_size'] = self.data.get('File Size')
+        return record
 
     # str function
     def __str__(self):
@@ -271,13 +1526,15 @@ class SharedFile:
 
 # helper class to represent individual games
 class Game:
+    __slots__ = ('name', 'appID', 'details', 'achievements', 'screenshots')
+
     # constructor
     def __init__(self, game):
         data = dict()
         for item in game:
             data[item.tag] = item.text
         if 'name' not in data or 'appID' not in data:
-            error_app("%s: %s" % (ERROR_INVALID_GAME, str(game)))
+            raise LoadError("%s: %s" % (ERROR_INVALID_GAME, str(game)))
         self.name = data['name']
         self.appID = data['appID']
         self.details = None
@@ -286,10 +1543,14 @@ class Game:
 
     # load game details
     def load_details(self, overwrite=False):
+        return run_async(self.load_details_async(overwrite=overwrite))
+    async def load_details_async(self, overwrite=False):
         if self.details is not None and not overwrite:
             return
         try:
-            self.details = jloads(urlopen(Request("%s%s" % (STEAM_APP_DETAILS_BASE_URL, self.appID),headers=URLLIB_HEADERS)).read().decode())[self.appID]['data']
+            page = await fetch_async("%s%s" % (STEAM_APP_DETAILS_BASE_URL, self.appID), 'appdetails')
+            with PROFILER.span('appdetails', 'parse'):
+                self.details = jloads(page)[self.appID]['data']
         except:
             self.details = dict()
         if 'supported_languages' in self.details:
@@ -297,49 +1558,111 @@ class Game:
 
     # load game achievements
     def load_achievements(self, username, overwrite=False):
+        return run_async(self.load_achievements_async(username, overwrite=overwrite))
+    async def load_achievements_async(self, username, overwrite=False):
         if self.achievements is not None and not overwrite:
             return
         url = "%s/%s/stats/%s" % (STEAM_COMMUNITY_BASE_URL, username, self.appID)
-        xml = ElementTree.parse(urlopen(Request(url + STEAM_URL_SUFFIX_XML,headers=URLLIB_HEADERS)))
-        xml_stats = None; xml_achievements = None
-        for curr in xml.getroot():
-            try:
-                #if curr.tag == 'stats':
-                #    xml_stats = curr
-                if curr.tag == 'achievements':
-                    xml_achievements = curr; break
-            except:
-                pass
-        self.achievements = [Achievement(curr) for curr in xml_achievements]
+        xml = await fetch_async(url + STEAM_URL_SUFFIX_XML, 'stats')
+        with PROFILER.span('stats', 'parse'):
+            self.achievements = parse_achievements_xml(xml)
 
     # load game screenshots
+    # ('on_page(screenshots)' is awaited as each page comes in, so later stages can start before the whole list is loaded)
     def load_screenshots(self, username, overwrite=False):
+        return run_async(self.load_screenshots_async(username, overwrite=overwrite))
+    async def load_screenshots_async(self, username, overwrite=False, on_page=None):
         if self.screenshots is not None and not overwrite:
             return
+        async def load_page_async(page_num, attempts=RETRY_MAX_ATTEMPTS):
+            page, total_num_screenshots = await self.load_screenshots_page_async(base_url, page_num, attempts)
+            if on_page is not None:
+                await on_page(page)
+            return page, total_num_screenshots
         message("%s: %s" % (TEXT_LOADING_SCREENSHOTS, self.name))
+        base_url = self.get_url_screenshots(username); self.screenshots = None
+
+        # load the first page to learn how many pages there are
+        message("%s: 1" % TEXT_LOADING_PAGE, end='\r')
+        first_page, total_num_screenshots = await load_page_async(1)
+        num_pages = -(-total_num_screenshots // len(first_page))
+        pages = {1:first_page}
+
+        # load the remaining pages concurrently, then retry any failed pages one at a time
+        failed_page_nums = list(); semaphore = Semaphore(NUM_PAGE_JOBS)
+        async def load_page(page_num):
+            async with semaphore:
+                try:
+                    pages[page_num] = (await load_page_async(page_num, 1))[0]
+                except Exception:
+                    failed_page_nums.append(page_num)
+            message("%s: %d of %d" % (TEXT_LOADING_PAGE, len(pages), num_pages), end='\r')
+        await gather(*[load_page(page_num) for page_num in range(2, num_pages+1)])
+        for page_num in sorted(failed_page_nums):
+            pages[page_num] = (await load_page_async(page_num))[0]
+            message("%s: %d of %d" % (TEXT_LOADING_PAGE, len(pages), num_pages), end='\r')
+
+        # merge pages in order (removing duplicates, e.g. if the grid shifted while loading)
+        screenshots = list(); seen = set()
+        def merge(page):
+            for screenshot in page:
+                if screenshot.ID not in seen:
+                    seen.add(screenshot.ID); screenshots.append(screenshot)
+        for page_num in range(1, num_pages+1):
+            merge(pages[page_num])
+        while len(screenshots) < total_num_screenshots: # pages were smaller than the first one, so keep going
+            num_pages += 1; num_before = len(screenshots)
+            merge((await load_page_async(num_pages))[0])
+            if len(screenshots) == num_before:
+                break
+        message(); self.screenshots = screenshots
+
+    # load screenshots that are newer than all known ones (walking pages newest first until reaching a known ID), returned oldest first
+    def load_new_screenshots(self, username, known_ids):
+        return run_async(self.load_new_screenshots_async(username, known_ids))
+    async def load_new_screenshots_async(self, username, known_ids):
+        base_url = self.get_url_screenshots(username, sort='newestfirst'); new_screenshots = list(); page_num = 1
+        while True:
+            message("%s: %d" % (TEXT_LOADING_PAGE, page_num), end='\r')
+            page, total_num_screenshots = await self.load_screenshots_page_async(base_url, page_num, refresh=True)
+            for screenshot in page:
+                if screenshot.ID in known_ids:
+                    message(); return new_screenshots[::-1]
+                new_screenshots.append(screenshot)
+            if len(new_screenshots) >= total_num_screenshots:
+                message(); return new_screenshots[::-1]
+            page_num += 1
+
+    # get the URL of the screenshot grid (without the page number at the end)
+    def get_url_screenshots(self, username, sort='oldestfirst'):
         base_url = "%s/%s/screenshots?appid=%s" % (STEAM_COMMUNITY_BASE_URL, username, self.appID)
-        base_url += "&sort=oldestfirst"
+        base_url += "&sort=%s" % sort
         base_url += "&browsefilter=myfiles"
         base_url += "&view=grid"
-        base_url += "&p=" # will populate with page number in loop below
-        self.screenshots = list()
-        curr_page_num = 1; total_num_screenshots = None
-        while total_num_screenshots is None or len(self.screenshots) < total_num_screenshots:
-            url = "%s%d" % (base_url, curr_page_num)
-            message("%s: %d" % (TEXT_LOADING_PAGE, curr_page_num), end='\r')
-            html_lines = urlopen(Request(url,headers=URLLIB_HEADERS)).read().decode().splitlines()
-            curr_page_screenshots = list()
-            for _ in range(NUM_SHARED_FILE_ATTEMPTS): # try multiple times (sometimes fails on first try)
-                curr_page_screenshots = [SharedFile(int(l.split('?id=')[1].split('"')[0])) for l in html_lines if 'filedetails' in l and '?id=' in l]
-                if len(curr_page_screenshots) != 0:
-                    break # successful download
-                sleep(REATTEMPT_DELAY)
-            if len(curr_page_screenshots) == 0:
-                error_app("%s: %s\n%s" % (ERROR_LOAD_SCREENSHOTS_FAILED, self.name, url), crash=False)
-                self.screenshots = None; return
-            self.screenshots += curr_page_screenshots; curr_page_num += 1
-            if total_num_screenshots is None:
-                total_num_screenshots = int([l for l in html_lines if 'Showing ' in l][0].split(' of ')[1].split('<')[0])
+        base_url += "&p=" # will populate with page number
+        return base_url
+
+    # load a single page of the screenshot grid, returned as a (screenshots, total number of screenshots) tuple
+    def load_screenshots_page(self, base_url, page_num, attempts=RETRY_MAX_ATTEMPTS, refresh=False):
+        return run_async(self.load_screenshots_page_async(base_url, page_num, attempts=attempts, refresh=refresh))
+    async def load_screenshots_page_async(self, base_url, page_num, attempts=RETRY_MAX_ATTEMPTS, refresh=False):
+        url = "%s%d" % (base_url, page_num)
+        async def attempt(attempt_num): # Steam sometimes serves an empty grid, so retry that too (past the cache)
+            page = await fetch_async(url, 'screenshots', refresh=(refresh or attempt_num != 0))
+            try:
+                with PROFILER.span('screenshots', 'parse'):
+                    IDs, total_num_screenshots = ScreenshotGridParser.parse(page)
+            except ValueError:
+                IDs = list()
+            if len(IDs) == 0 or total_num_screenshots is None:
+                raise TransientError("%s: %s\n%s" % (ERROR_LOAD_SCREENSHOTS_FAILED, self.name, url))
+            return [SharedFile(ID) for ID in IDs], total_num_screenshots
+        try:
+            return await RETRY_POLICY.call('screenshots', url, attempt, attempts=attempts, transient_only=True)
+        except LoadError:
+            raise
+        except Exception as e:
+            raise LoadError("%s: %s\n%s (%s)" % (ERROR_LOAD_SCREENSHOTS_FAILED, self.name, url, e))
 
     # view game details
     def view_details(self):
@@ -371,14 +1694,17 @@ class Game:
 
     # view game achievements
     def view_achievements(self, username=None):
-        self.load_achievements(username)
+        try:
+            self.load_achievements(username)
+        except Exception as e: # e.g. a network error (the game stays in the list, so selecting it again retries)
+            error_app(str(e), crash=False); return
         locked = list(); unlocked = list()
         for achievement in self.achievements:
             if achievement.unlock_time is None:
                 locked.append((achievement, HTML('<ansired>%s</ansired>' % achievement.name)))
             else:
                 unlocked.append((achievement, HTML('<ansigreen>%s</ansigreen>' % achievement.name)))
-        achievement_list_dialog = radiolist_dialog(title=HTML("<ansiblue>%s</ansiblue> <ansiblack>(<ansigreen>%d</ansigreen>/%d)</ansiblack>" % (self.name, len(unlocked), len(self.achievements))), values=unlocked+locked)
+        achievement_list_dialog = ListDialog(title=HTML("<ansiblue>%s</ansiblue> <ansiblack>(<ansigreen>%d</ansigreen>/%d)</ansiblack>" % (self.name, len(unlocked), len(self.achievements))), values=unlocked+locked)
         while True:
             achievement_selection = achievement_list_dialog.run()
             if achievement_selection is None:
@@ -387,35 +1713,119 @@ class Game:
 
     # view game screenshots
     def view_screenshots(self, username=None):
-        self.load_screenshots(username)
-        if self.screenshots is None:
-            return # loading screenshots failed
-        values = [('download_all',HTML("<ansigreen>Download All</ansigreen>"))] + [(screenshot, str(screenshot.ID)) for screenshot in self.screenshots]
+        try:
+            self.load_screenshots(username)
+        except LoadError as e:
+            error_app(str(e), crash=False); return
+        values = [('download_all',HTML("<ansigreen>Download All</ansigreen>")), ('sync',HTML("<ansigreen>Sync New</ansigreen>"))] + [(screenshot, str(screenshot.ID)) for screenshot in self.screenshots]
         title_str = clean_html("<ansiblue>%s</ansiblue> <ansiblack>(%d screenshots)</ansiblack>" % (self.name, len(self.screenshots)))
-        screenshot_list_dialog = radiolist_dialog(title=HTML(title_str), values=values)
+        screenshot_list_dialog = ListDialog(title=HTML(title_str), values=values)
         while True:
             screenshot_selection = screenshot_list_dialog.run()
             if screenshot_selection is None:
                 break
             elif screenshot_selection == 'download_all':
                 self.download_all_screenshots()
+            elif screenshot_selection == 'sync':
+                destination = select_path_app(files=False)
+                if destination is not None:
+                    try:
+                        num_new, failed = self.sync_screenshots(username, destination)
+                    except LoadError as e:
+                        error_app(str(e), crash=False); continue
+                    if len(failed) != 0:
+                        error_app("%s: %d of %d\n%s" % (ERROR_DOWNLOAD_SCREENSHOTS_FAILED, len(failed), num_new, '\n'.join(str(e) for _, e in failed[:10])), crash=False)
+                    else:
+                        message_app("%s: %d" % (TEXT_NEW_SCREENSHOTS, num_new))
             else:
                 screenshot_selection.view_details()
 
-    # download all screenshots
-    def download_all_screenshots(self):
+    # download all screenshots (into a folder, or into one tar/zip archive in a folder)
+    def download_all_screenshots(self, jobs=None):
+        fmt = radiolist_dialog(title=HTML("<ansiblue>%s</ansiblue>" % self.name), text=TEXT_SAVE_AS, values=[('folder', "Separate files")] + [(fmt, "%s archive" % fmt) for fmt in ARCHIVE_FORMATS]).run()
+        if fmt is None:
+            return
         destination = select_path_app(files=False)
         if destination is None:
             return
-        for i, screenshot in enumerate(self.screenshots):
-            message("Downloading screenshot %d of %d" % (i+1, len(self.screenshots)), end='\r')
-            screenshot.load_data(); posted_date = screenshot.data['Posted']
-            out_path = "%s/%s_%s.jpg" % (destination, str(posted_date).replace(':','-').replace(' ','_'), screenshot.ID)
-            screenshot.download(out_path); File(out_path).set(created=posted_date, modified=posted_date, accessed=posted_date)
+        if jobs is None:
+            jobs = NUM_DOWNLOAD_JOBS
+        if fmt == 'folder':
+            failed = download_shared_files(self.screenshots, destination, jobs=jobs)
+        else:
+            archive_path = "%s/%s.%s" % (destination, ''.join(c if c.isalnum() or c in ' -_.' else '_' for c in self.name).strip(), fmt)
+            if isfile(archive_path):
+                error_app("%s: %s" % (ERROR_FILE_EXISTS, archive_path), crash=False); return
+            with open(archive_path, 'wb') as out:
+                archive = ArchiveWriter(out, fmt)
+                try:
+                    failed = download_shared_files(self.screenshots, '', jobs=jobs, archive=archive)
+                finally:
+                    archive.close()
+        if len(failed) != 0:
+            error_app("%s: %d of %d\n%s" % (ERROR_DOWNLOAD_SCREENSHOTS_FAILED, len(failed), len(self.screenshots), '\n'.join(str(e) for _, e in failed[:10])), crash=False)
+
+    # download screenshots that aren't in the folder's manifest yet, returned as a (number of new screenshots, failures) tuple
+    def sync_screenshots(self, username, destination, manifest=None, jobs=None):
+        if manifest is None:
+            manifest = Manifest(destination)
+        if jobs is None:
+            jobs = NUM_DOWNLOAD_JOBS
+        message("%s: %s" % (TEXT_SYNCING_SCREENSHOTS, self.name))
+        try:
+            return run_async(self.sync_screenshots_async(username, destination, manifest, jobs))
+        finally:
+            manifest.save()
+    async def sync_screenshots_async(self, username, destination, manifest, jobs):
+        known_ids = manifest.get_ids(self.appID); complete = self.appID in manifest.complete; manifest.set_complete(self.appID, False)
+        async with DownloadPipeline(destination, image_jobs=jobs, callback=lambda screenshot: manifest.add(self.appID, screenshot)) as pipeline:
+            if len(known_ids) == 0 or not complete: # never synced (or the last sync didn't finish, so there may be gaps), so list everything (in parallel), downloading each page while the rest are still loading
+                async def on_page(page):
+                    for screenshot in page:
+                        if str(screenshot.ID) not in manifest.entries:
+                            await pipeline.put(screenshot)
+                await self.load_screenshots_async(username, overwrite=True, on_page=on_page)
+            else:
+                for screenshot in await self.load_new_screenshots_async(username, known_ids):
+                    await pipeline.put(screenshot)
+                for ID in sorted(manifest.get_failed_ids(self.appID)): # older failures aren't reached by walking new screenshots, so retry them directly
+                    await pipeline.put(SharedFile(ID))
+        for shared_file, _ in pipeline.failed:
+            manifest.add_failed(self.appID, shared_file)
+        manifest.set_complete(self.appID, True)
+        return pipeline.num_queued, pipeline.failed
+
+    # download all screenshots into an archive (in folder 'folder' of the archive), downloading each list page while the rest are still loading
+    # (returned as a (number of screenshots, failures) tuple, and the screenshot list is released afterwards)
+    def archive_screenshots(self, username, archive, folder='', jobs=None):
+        return run_async(self.archive_screenshots_async(username, archive, folder=folder, jobs=jobs))
+    async def archive_screenshots_async(self, username, archive, folder='', jobs=None):
+        async with DownloadPipeline(folder, image_jobs=jobs, archive=archive) as pipeline:
+            async def on_page(page):
+                for screenshot in page:
+                    await pipeline.put(screenshot)
+            await self.load_screenshots_async(username, overwrite=True, on_page=on_page)
+        self.screenshots = None
+        return pipeline.num_queued, pipeline.failed
+
+    # get a flat record of this game (including its details if they have been loaded) for exporting
+    def record(self):
+        record = {'appID':self.appID, 'name':self.name}
+        if self.details is not None:
+            record['release_date'] = self.details.get('release_date', dict()).get('date')
+            record['developers'] = self.details.get('developers')
+            record['publishers'] = self.details.get('publishers')
+            record['price'] = self.details.get('price_overview', dict()).get('final_formatted')
+            record['genres'] = [g['description'] for g in self.details.get('genres', list())]
+            record['categories'] = [c['description'] for c in self.details.get('categories', list())]
+            record['controller_support'] = self.details.get('controller_support')
+            record['supported_languages'] = self.details.get('supported_languages')
+            record['achievements'] = self.details.get('achievements', dict()).get('total')
+        return record
 
     # str function
     def __str__(self):
-        return str(self.__dict__)
+        return str({k:getattr(self, k) for k in self.__slots__})
 
     # comparison functions
     def __lt__(self, o):
@@ -429,19 +1839,85 @@ class Game:
     def __eq__(self, o):
         return type(self) == type(o) and self.appID == o.appID
 
+# index of the achievements of a whole library (sorted by unlock time and by completion percentage, so views can query it instantly)
+class AchievementIndex:
+    __slots__ = ('completion', 'unlocked', 'num_unlocked', 'num_achievements', 'num_failed')
+
+    # constructor ('games' = games with loaded achievements; games without achievements are left out)
+    def __init__(self, games, num_failed=0):
+        self.completion = list(); self.unlocked = list(); self.num_achievements = 0; self.num_failed = num_failed
+        for game in games:
+            if not game.achievements:
+                continue
+            num_unlocked = 0
+            for achievement in game.achievements:
+                if achievement.unlock_time is not None:
+                    self.unlocked.append((achievement.unlock_time, game, achievement)); num_unlocked += 1
+            self.completion.append((100 * num_unlocked / len(game.achievements), num_unlocked, len(game.achievements), game))
+            self.num_achievements += len(game.achievements)
+        self.completion.sort(key=lambda entry: (-entry[0], entry[3]))
+        self.unlocked.sort(key=lambda entry: entry[0], reverse=True)
+        self.num_unlocked = len(self.unlocked)
+
+    # overall completion percentage
+    @property
+    def percentage(self):
+        return 0 if self.num_achievements == 0 else 100 * self.num_unlocked / self.num_achievements
+
+    # most recently unlocked achievements (newest first) as (unlock time, game, achievement) tuples
+    def recent(self, num=NUM_RECENTLY_UNLOCKED):
+        return self.unlocked[:num]
+
+    # view most recently unlocked achievements
+    def view_recent(self, username):
+        values = [(achievement, "%s - %s: %s" % (unlock_time, game.name, achievement.name)) for unlock_time, game, achievement in self.recent()]
+        achievement_list_dialog = ListDialog(title=HTML("<ansiblue>%s's %s</ansiblue>" % (username, TEXT_RECENTLY_UNLOCKED)), values=values)
+        while True:
+            achievement_selection = achievement_list_dialog.run()
+            if achievement_selection is None:
+                break
+            achievement_selection.view_details()
+
+    # view games sorted by completion percentage
+    def view_completion(self, username, url_name):
+        values = [(game, "%5.1f%% (%d/%d) %s" % (percentage, num_unlocked, num_achievements, game.name)) for percentage, num_unlocked, num_achievements, game in self.completion]
+        game_list_dialog = ListDialog(title=HTML("<ansiblue>%s's %s</ansiblue>" % (username, TEXT_COMPLETION)), values=values)
+        while True:
+            game_selection = game_list_dialog.run()
+            if game_selection is None:
+                break
+            game_selection.view_achievements(url_name)
+
 # helper class to represent a user
 class User:
-    # constructor
+    # constructor (only the profile is loaded right away: the game library loads in the background, and games with screenshots are loaded when first needed)
     def __init__(self, username):
-        # prepare for loading user data
+        self.prepare(username); run_async(self.load_profile_async())
+
+    # asynchronous counterpart of the constructor
+    @classmethod
+    async def load_async(cls, username):
+        user = cls.__new__(cls); user.prepare(username); await user.load_profile_async()
+        return user
+
+    # prepare for loading user data (and start loading game data while the profile loads)
+    def prepare(self, username):
         message(s="%s: %s" % (TEXT_LOADING_USER_DATA, username))
-        url_community = "%s/%s" % (STEAM_COMMUNITY_BASE_URL, username)
-        url_games = "%s/games" % url_community
-        url_screenshots = "%s/screenshots" % url_community
+        self.url_name = username # name in profile URLs (the display name 'self.username' can differ)
+        self.url_community = "%s/%s" % (STEAM_COMMUNITY_BASE_URL, username)
+        self.url_games = "%s/games" % self.url_community
+        self.url_screenshots = "%s/screenshots" % self.url_community
+        self.lock = Lock(); self.screenshots_future = None; self.achievements_future = None; self.details_future = None
+        self.games_future = submit_async(self.load_games_async())
 
-        # load user data
-        xml = ElementTree.parse(urlopen(Request(url_community + STEAM_URL_SUFFIX_XML,headers=URLLIB_HEADERS)))
-        for curr in xml.getroot():
+    # load user data
+    async def load_profile_async(self):
+        page = await fetch_async(self.url_community + STEAM_URL_SUFFIX_XML, 'profile')
+        with PROFILER.span('profile', 'parse'):
+            xml = ElementTree.fromstring(page)
+        for curr in xml:
+            if curr.tag == 'error':
+                raise LoadError("%s: %s" % (ERROR_PROFILE_NOT_FOUND, curr.text.strip()))
             try:
                 if curr.tag == 'steamID':
                     self.username = curr.text.strip()
@@ -460,23 +1936,100 @@ class User:
             except:
                 pass
 
-        # load game data
-        xml = ElementTree.parse(urlopen(Request(url_games + STEAM_URL_SUFFIX_XML,headers=URLLIB_HEADERS))); xml_games = None
-        for curr in xml.getroot():
-            if curr.tag == 'error':
-                error_app(curr.text.strip())
-            try:
-                if curr.tag == 'games':
-                    xml_games = curr; break
-            except Exception as e:
-                pass
-        if xml_games is None:
-            error_app(ERROR_LOAD_GAMES_FAILED)
-        self.games_list = sorted(Game(xml_game) for xml_game in xml_games)
-        self.games_map = {game.appID:game for game in self.games_list}
+    # load game data (returns the list of games and a map from app ID to game)
+    async def load_games_async(self):
+        xml = await fetch_async(self.url_games + STEAM_URL_SUFFIX_XML, 'games')
+        with PROFILER.span('games', 'parse'):
+            games_list = parse_games_xml(xml)
+        return games_list, {game.appID:game for game in games_list}
+
+    # load the app IDs of games with screenshots
+    async def load_games_with_screenshots_async(self):
+        page = await fetch_async(self.url_screenshots, 'screenshots')
+        with PROFILER.span('screenshots', 'parse'):
+            return ScreenshotFilterParser.parse(page)
+
+    # start loading the library in the background (again if it failed, so opening the menu again retries it)
+    def prefetch_games(self):
+        with self.lock:
+            if future_failed(self.games_future):
+                self.games_future = submit_async(self.load_games_async())
+            return self.games_future
+
+    # start loading games with screenshots in the background (if not already started, or again if it failed)
+    def prefetch_games_with_screenshots(self):
+        with self.lock:
+            if self.screenshots_future is None or future_failed(self.screenshots_future):
+                self.screenshots_future = submit_async(self.load_games_with_screenshots_async())
+            return self.screenshots_future
+
+    # load achievements of all games in the library concurrently (games without achievements get an empty list, and failed games are counted)
+    def load_all_achievements(self, jobs=NUM_ACHIEVEMENT_JOBS, overwrite=False):
+        return run_async(self.load_all_achievements_async(jobs=jobs, overwrite=overwrite))
+    async def load_all_achievements_async(self, jobs=NUM_ACHIEVEMENT_JOBS, overwrite=False):
+        games = await self.get_games_list_async(); num_failed = 0; semaphore = Semaphore(jobs)
+        async def load_achievements(game):
+            nonlocal num_failed
+            async with semaphore:
+                try:
+                    await game.load_achievements_async(self.url_name, overwrite)
+                except Exception as e:
+                    if is_missing_stats(e):
+                        game.achievements = list()
+                    else:
+                        num_failed += 1
+        await gather(*[load_achievements(game) for game in games])
+        return AchievementIndex(games, num_failed)
 
-        # load games with screenshots
-        self.games_with_screenshots = {l.split("'appid': '")[1].split("'")[0] for l in urlopen(Request(url_screenshots,headers=URLLIB_HEADERS)).read().decode().splitlines() if 'javascript:SelectSharedFilesContentFilter' in l and 'appid' in l}
+    # start loading achievements of all games in the background (if not already started, or again if it failed)
+    def prefetch_achievements(self):
+        with self.lock:
+            if self.achievements_future is None or future_failed(self.achievements_future):
+                self.achievements_future = submit_async(self.load_all_achievements_async())
+            return self.achievements_future
+
+    # lazily-loaded data (each blocks until loaded, and raises if loading failed; coroutines should await the *_async versions instead)
+    @property
+    def games_list(self):
+        return self.games_future.result()[0]
+    @property
+    def games_map(self):
+        return self.games_future.result()[1]
+    @property
+    def games_with_screenshots(self):
+        return self.prefetch_games_with_screenshots().result()
+    @property
+    def achievement_index(self):
+        return self.prefetch_achievements().result()
+    async def get_games_list_async(self):
+        return (await wrap_future(self.games_future))[0]
+    async def get_games_with_screenshots_async(self):
+        return await wrap_future(self.prefetch_games_with_screenshots())
+
+    # load details of all games in the library concurrently (respecting the store API rate limit)
+    def load_all_details(self, jobs=NUM_DETAILS_JOBS, overwrite=False, games=None, progress=True):
+        return run_async(self.load_all_details_async(jobs=jobs, overwrite=overwrite, games=games, progress=progress))
+    async def load_all_details_async(self, jobs=NUM_DETAILS_JOBS, overwrite=False, games=None, progress=True): # 'games' = only these games (default: whole library)
+        if games is None:
+            games = await self.get_games_list_async()
+        games = [game for game in games if game.details is None or overwrite]; num_done = 0; semaphore = Semaphore(jobs)
+        async def load_details(game):
+            nonlocal num_done
+            async with semaphore:
+                await game.load_details_async(overwrite)
+            num_done += 1
+            if progress:
+                message("%s: %d of %d" % (TEXT_LOADING_DETAILS, num_done, len(games)), end='\r')
+        await gather(*[load_details(game) for game in games])
+        if progress and len(games) != 0:
+            message()
+
+    # start loading details of all games in the background (if not already started; no progress messages, so it can run behind the dialogs)
+    def prefetch_details(self):
+        with self.lock:
+            if self.details_future is None:
+                self.details_future = submit_async(self.load_all_details_async(progress=False))
+            return self.details_future
 
     # comparison functions
     def __lt__(self, o):
@@ -490,8 +2043,21 @@ class User:
     def __eq__(self, o):
         return self.username == o.username
 
-    # user main page
+    # label of a main page entry, with a count (computed by 'get_count' from the result of 'future') that fills in once 'future' is done (prompt_toolkit calls it on every redraw)
+    def count_label(self, name, future, get_count):
+        def label():
+            if not future.done():
+                count = TEXT_LOADING
+            elif future.exception() is not None:
+                count = ERROR_LOAD_DATA_FAILED
+            else:
+                count = "%d games" % get_count(future.result())
+            return HTML("<ansiblue>%s</ansiblue> (%s)" % (name, count))
+        return label
+
+    # user main page (shown as soon as the profile is loaded)
     def view_main(self):
+        self.prefetch_games(); screenshots_future = self.prefetch_games_with_screenshots(); achievements_future = self.prefetch_achievements()
         online_state_color = {True:'green', False:'red'}[self.online_state == 'Online']
         title=HTML('<ansiblue>%s (<ansi%s>%s</ansi%s>)</ansiblue>' % (self.username, online_state_color, self.online_state, online_state_color))
         text = '<ansired>- SteamID64:</ansired> %s' % self.steamID64
@@ -502,39 +2068,62 @@ class User:
         if hasattr(self, 'member_since'):
             text += '\n<ansired>- Member Since:</ansired> %s' % self.member_since
         text = HTML(text.strip())
-        if len(self.games_list) == 0:
+        if self.games_future.done() and self.games_future.exception() is None and len(self.games_list) == 0:
             message_dialog(title=title, text=text).run()
         else:
-            return radiolist_dialog(title=title, text=text, values=[
-                (self.view_library, HTML("<ansiblue>Library</ansiblue> (%d games)" % len(self.games_list))),
-                (self.view_achievements, HTML("<ansiblue>Achievements</ansiblue>")),
-                (self.view_screenshots, HTML("<ansiblue>Screenshots</ansiblue> (%d games)" % len(self.games_with_screenshots))),
-            ]).run()
+            app = radiolist_dialog(title=title, text=text, values=[
+                (self.view_library, self.count_label("Library", self.games_future, lambda result: len(result[0]))),
+                (self.view_achievements, self.count_label("Achievements", achievements_future, lambda index: len(index.completion))),
+                (self.view_screenshots, self.count_label("Screenshots", screenshots_future, len)),
+            ])
+            for future in [self.games_future, screenshots_future, achievements_future]: # redraw when counts come in
+                future.add_done_callback(lambda _: app.invalidate())
+            return app.run()
 
     # view games
     def view_games(self, mode):
+        try:
+            self.games_list
+            if mode == 'screenshots':
+                self.games_with_screenshots
+        except Exception as e: # loaded in the background, so this can be any network error (the main page retries it)
+            error_app(str(e), crash=False); return self.view_main
         if mode == 'library':
             title = HTML("<ansiblue>%s's Library</ansiblue> <ansiblack>(%d games)</ansiblack>" % (self.username, len(self.games_list)))
             values = [(game,game.name) for game in self.games_list]
-        elif mode == 'achievements':
-            title = HTML("<ansiblue>%s's Achievements</ansiblue>" % self.username)
-            values = [(game,game.name) for game in self.games_list]
+        elif mode == 'achievements': # use the library-wide index if it's done loading (otherwise, each game loads when selected)
+            index = None
+            if self.achievements_future is not None and self.achievements_future.done() and self.achievements_future.exception() is None:
+                index = self.achievement_index
+            if index is None:
+                title = HTML("<ansiblue>%s's Achievements</ansiblue>" % self.username)
+                values = [(game,game.name) for game in self.games_list]
+            else:
+                failed = (", <ansired>%d games failed to load</ansired>" % index.num_failed) if index.num_failed != 0 else ''
+                title = HTML("<ansiblue>%s's Achievements</ansiblue> <ansiblack>(<ansigreen>%d</ansigreen>/%d, %.1f%%%s)</ansiblack>" % (self.username, index.num_unlocked, index.num_achievements, index.percentage, failed))
+                values = [('recent',HTML("<ansigreen>%s</ansigreen>" % TEXT_RECENTLY_UNLOCKED)), ('completion',HTML("<ansigreen>%s</ansigreen>" % TEXT_COMPLETION))] + [(game,game.name) for game in self.games_list if game.achievements is None or len(game.achievements) != 0] # games that failed to load are kept (they load when selected)
         elif mode == 'screenshots':
             title = HTML("<ansiblue>%s's Screenshots</ansiblue> <ansiblack>(%d games)</ansiblack>" % (self.username, len(self.games_with_screenshots)))
             values = [(game,game.name) for game in self.games_list if game.appID in self.games_with_screenshots]
         else:
             error_app(ERROR_INVALID_GAMES_LIST_MODE)
-        game_list_dialog = radiolist_dialog(title=title, values=values)
+        if len(values) == 0:
+            message_dialog(title=title, text=TEXT_NO_GAMES).run(); return self.view_main
+        game_list_dialog = ListDialog(title=title, values=values)
         while True:
             game_selection = game_list_dialog.run()
             if game_selection is None:
                 break
-            if mode == 'library':
+            if game_selection == 'recent':
+                index.view_recent(self.username)
+            elif game_selection == 'completion':
+                index.view_completion(self.username, self.url_name)
+            elif mode == 'library':
                 game_selection.view_details()
             elif mode == 'achievements':
-                game_selection.view_achievements(self.username)
+                game_selection.view_achievements(self.url_name)
             elif mode == 'screenshots':
-                game_selection.view_screenshots(self.username)
+                game_selection.view_screenshots(self.url_name)
         return self.view_main
     def view_library(self):
         return self.view_games('library')
@@ -543,20 +2132,470 @@ class User:
     def view_screenshots(self):
         return self.view_games('screenshots')
 
+# map a function over items in parallel, yielding results in order while keeping at most 'window' items in flight
+def parallel_map(func, items, jobs, window=None):
+    if window is None:
+        window = 4 * jobs
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = deque()
+        for item in items:
+            futures.append(executor.submit(func, item))
+            if len(futures) >= window:
+                yield futures.popleft().result()
+        while len(futures) != 0:
+            yield futures.popleft().result()
+
+# write records to a file as NDJSON or CSV (one record at a time, flushing after each)
+class RecordWriter:
+    # constructor
+    def __init__(self, out, fmt, fields):
+        self.out = out; self.fmt = fmt
+        if fmt == 'csv':
+            self.csv_writer = DictWriter(out, fieldnames=fields, extrasaction='ignore'); self.csv_writer.writeheader()
+
+    # write a single record
+    def write(self, record):
+        if self.fmt == 'csv':
+            self.csv_writer.writerow({k:(CSV_LIST_SEPARATOR.join(str(x) for x in v) if isinstance(v, list) else v) for k,v in record.items()})
+        else:
+            self.out.write(jdumps(record)); self.out.write('\n')
+        self.out.flush()
+
+# get the ISO 8601 date (e.g. '2020-01-01', or '2020-01' if Steam only gives the month) of a store release date, or None if it isn't a date (e.g. 'Coming soon')
+def parse_release_date(text):
+    for release_date_format, iso_format in LIBRARY_DB_RELEASE_DATE_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), release_date_format).strftime(iso_format)
+        except (AttributeError, ValueError):
+            pass
+    return None
+
+# local database of normalised game details (indexed for offline queries, and refreshed incrementally: only missing or old games are reloaded)
+class LibraryDatabase:
+    # constructor
+    def __init__(self, path=LIBRARY_DB_PATH):
+        makedirs('/'.join(path.split('/')[:-1]), exist_ok=True)
+        self.lock = Lock()
+        self.db = sqlite3_connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS games (appID TEXT PRIMARY KEY, name TEXT, release_date TEXT, release_date_text TEXT, price INTEGER, currency TEXT, price_formatted TEXT, achievements INTEGER, controller_support TEXT, updated REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS tags (kind TEXT, value TEXT COLLATE NOCASE, appID TEXT, PRIMARY KEY (kind, value, appID)) WITHOUT ROWID")
+        self.db.execute("CREATE TABLE IF NOT EXISTS owners (username TEXT COLLATE NOCASE, appID TEXT, PRIMARY KEY (username, appID)) WITHOUT ROWID")
+        self.db.execute("CREATE INDEX IF NOT EXISTS games_price ON games (price)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS games_controller_support ON games (controller_support)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS tags_appID ON tags (appID)")
+        self.db.commit()
+
+    # replace the library of a user
+    def set_library(self, username, games):
+        with self.lock:
+            self.db.execute("DELETE FROM owners WHERE username=?", (username,))
+            self.db.executemany("INSERT INTO owners VALUES (?, ?)", [(username, game.appID) for game in games]); self.db.commit()
+
+    # get the games whose details are missing or older than 'max_age' seconds
+    def get_stale(self, games, max_age=LIBRARY_DB_MAX_AGE):
+        with self.lock:
+            updated = dict(self.db.execute("SELECT appID, updated FROM games").fetchall())
+        oldest = time() - max_age
+        return [game for game in games if updated.get(game.appID, 0) < oldest]
+
+    # add (or replace) the details of games (games without details are skipped, so they're tried again next time)
+    def put(self, games):
+        rows = list(); tags = list(); now = time()
+        for game in games:
+            if not game.details:
+                continue
+            price = game.details.get('price_overview', dict())
+            if game.details.get('is_free'):
+                price = dict({'final':0}, **price)
+            release_date = game.details.get('release_date', dict()).get('date')
+            rows.append((game.appID, game.name, parse_release_date(release_date), release_date, price.get('final'), price.get('currency'), price.get('final_formatted'), game.details.get('achievements', dict()).get('total'), game.details.get('controller_support'), now))
+            for kind, key in LIBRARY_DB_TAG_KINDS.items():
+                values = game.details.get(key, list())
+                if kind in {'genre', 'category'}:
+                    values = [v['description'] for v in values]
+                elif kind == 'language': # drop the footnote marks (and the footnote) of languages with full audio support
+                    values = [v.strip().rstrip('*') for v in values if not v.strip().startswith('*')]
+                tags += [(kind, v, game.appID) for v in set(values) if v]
+        with self.lock:
+            self.db.executemany("DELETE FROM tags WHERE appID=?", [(row[0],) for row in rows])
+            self.db.executemany("INSERT OR REPLACE INTO games (appID, name, release_date, release_date_text, price, currency, price_formatted, achievements, controller_support, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.executemany("INSERT OR IGNORE INTO tags VALUES (?, ?, ?)", tags); self.db.commit()
+        return len(rows)
+
+    # find games (as library export records, sorted by name) matching all of the given filters
+    # ('tags' maps a tag kind to the values a game needs to have, 'max_price' is in the store currency, and 'controller_support' is in LIBRARY_DB_CONTROLLER_SUPPORT)
+    # (release dates are ISO 8601, or Steam's text if it isn't a date, e.g. 'Coming soon')
+    def query(self, username=None, tags=None, max_price=None, controller_support=None, name=None):
+        sql = "SELECT appID, name, COALESCE(release_date, release_date_text), price_formatted, achievements, controller_support FROM games WHERE 1"; args = list()
+        if username is not None:
+            sql += " AND appID IN (SELECT appID FROM owners WHERE username=?)"; args.append(username)
+        for kind, values in (tags or dict()).items():
+            for value in values:
+                sql += " AND appID IN (SELECT appID FROM tags WHERE kind=? AND value=?)"; args += [kind, value]
+        if max_price is not None:
+            sql += " AND price <= ?"; args.append(round(100 * max_price))
+        if controller_support == 'any':
+            sql += " AND controller_support IS NOT NULL"
+        elif controller_support is not None:
+            sql += " AND controller_support=?"; args.append(controller_support)
+        if name is not None:
+            sql += " AND name LIKE ?"; args.append('%%%s%%' % name)
+        with self.lock:
+            records = [{'appID':appID, 'name':game_name, 'release_date':release_date, 'price':price, 'achievements':achievements, 'controller_support':controller} for appID, game_name, release_date, price, achievements, controller in self.db.execute(sql + " ORDER BY name COLLATE NOCASE", args)]
+            by_appID = {record['appID']:dict(record, **{key:list() for key in LIBRARY_DB_TAG_KINDS.values()}) for record in records}
+            for i in range(0, len(records), LIBRARY_DB_QUERY_CHUNK_SIZE): # tags of the matching games (looked up through the appID index)
+                app_ids = [record['appID'] for record in records[i:i+LIBRARY_DB_QUERY_CHUNK_SIZE]]
+                for appID, kind, value in self.db.execute("SELECT appID, kind, value FROM tags WHERE appID IN (%s) ORDER BY value" % ', '.join('?' * len(app_ids)), app_ids):
+                    by_appID[appID][LIBRARY_DB_TAG_KINDS[kind]].append(value)
+        return list(by_appID.values())
+
+# update the library database with a user's games (only loading details of games that are missing or older than 'max_age' seconds)
+def update_library_db(user, db, max_age=LIBRARY_DB_MAX_AGE, jobs=NUM_DETAILS_JOBS):
+    db.set_library(user.url_name, user.games_list)
+    games = db.get_stale(user.games_list, max_age=max_age)
+    user.load_all_details(jobs=jobs, overwrite=True, games=games)
+    message("%s: %d of %d" % (TEXT_STORED_DETAILS, db.put(games), len(games)))
+
+# generate library records (optionally loading game details in parallel)
+def library_records(games, details=False, jobs=NUM_DETAILS_JOBS):
+    def load(game):
+        if details:
+            game.load_details()
+        return game.record()
+    return parallel_map(load, games, jobs)
+
+# generate achievement records (loading each game's achievements in parallel, and releasing them once exported)
+def achievement_records(games, username, jobs=NUM_DETAILS_JOBS):
+    def load(game):
+        try:
+            game.load_achievements(username)
+        except Exception as e:
+            if not is_missing_stats(e):
+                error("%s: %s" % (game.name, e), crash=False)
+            return list()
+        records = [dict({'appID':game.appID, 'game':game.name}, **achievement.record()) for achievement in game.achievements]
+        game.achievements = None; return records
+    for records in parallel_map(load, games, jobs):
+        yield from records
+
+# generate screenshot records (loading shared file details in parallel, and releasing them once exported)
+def screenshot_records(games, username, jobs=NUM_DOWNLOAD_JOBS):
+    for game in games:
+        try:
+            game.load_screenshots(username)
+        except LoadError as e:
+            error(str(e), crash=False); continue
+        def load(screenshot):
+            try:
+                screenshot.load_data()
+            except Exception as e:
+                error(str(e), crash=False)
+            return dict({'appID':game.appID, 'game':game.name}, **screenshot.record())
+        yield from parallel_map(load, game.screenshots, jobs)
+        game.screenshots = None
+
+# export records of a given kind for a user without any dialogs
+def export(kind, username, out, fmt='ndjson', app_ids=None, details=False, jobs=NUM_DOWNLOAD_JOBS):
+    user = User(username)
+    if app_ids is not None:
+        games = [user.games_map[app_id] for app_id in app_ids if app_id in user.games_map]
+    elif kind == 'screenshots':
+        games = [game for game in user.games_list if game.appID in user.games_with_screenshots]
+    else:
+        games = user.games_list
+    if kind == 'library':
+        records = library_records(games, details=details, jobs=jobs)
+    elif kind == 'achievements':
+        records = achievement_records(games, username, jobs=jobs)
+    else:
+        records = screenshot_records(games, username, jobs=jobs)
+    writer = RecordWriter(out, fmt, EXPORT_FIELDS[kind])
+    for record in records:
+        writer.write(record)
+
+# sync screenshots of a user's games into a folder (only downloading new ones), returning the number of failed downloads
+def sync(username, destination, app_ids=None, jobs=NUM_DOWNLOAD_JOBS):
+    user = User(username); manifest = Manifest(destination); num_new = 0; num_failed = 0
+    games = [game for game in user.games_list if game.appID in user.games_with_screenshots and (app_ids is None or game.appID in app_ids)]
+    for game in games:
+        try:
+            game_num_new, failed = game.sync_screenshots(username, destination, manifest=manifest, jobs=jobs)
+        except LoadError as e:
+            error(str(e), crash=False); num_failed += 1; continue
+        num_new += game_num_new; num_failed += len(failed)
+        for shared_file, e in failed:
+            error("%s: %s" % (shared_file.ID, e), crash=False)
+    message("%s: %d (%d failed)" % (TEXT_NEW_SCREENSHOTS, num_new, num_failed))
+    return num_failed
+
+# stream all screenshots of a user's games into one tar/zip archive written to 'out' (one folder per app ID), returning the number of failed downloads
+def archive_screenshots(username, out, fmt=ARCHIVE_FORMATS[0], app_ids=None, jobs=None):
+    user = User(username); archive = ArchiveWriter(out, fmt); num_files = 0; num_failed = 0
+    games = [game for game in user.games_list if game.appID in user.games_with_screenshots and (app_ids is None or game.appID in app_ids)]
+    try:
+        for game in games:
+            message("%s: %s" % (TEXT_ARCHIVING_SCREENSHOTS, game.name))
+            try:
+                game_num_files, failed = game.archive_screenshots(username, archive, folder=game.appID, jobs=jobs)
+            except LoadError as e:
+                error(str(e), crash=False); num_failed += 1; continue
+            num_files += game_num_files - len(failed); num_failed += len(failed)
+            for shared_file, e in failed:
+                error("%s: %s" % (shared_file.ID, e), crash=False)
+    finally:
+        archive.close()
+    message("%s: %d (%d failed)" % (TEXT_ARCHIVED_SCREENSHOTS, num_files, num_failed))
+    return num_failed
+
+# scheduler that runs the tasks of several accounts on one shared worker pool
+# (tasks are started round robin between accounts, so one slow or huge account can't hold up the rest)
+class BatchScheduler:
+    # constructor
+    def __init__(self, jobs=NUM_BATCH_JOBS):
+        self.jobs = jobs; self.queues = dict(); self.turns = deque()
+
+    # queue a task for an account
+    def submit(self, key, func, *args):
+        if key not in self.queues:
+            self.queues[key] = deque(); self.turns.append(key)
+        self.queues[key].append((func, args))
+
+    # run queued tasks (including ones queued while running), yielding (key, result, exception) tuples as they finish
+    def results(self):
+        running = dict()
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while True:
+                while len(running) < self.jobs and len(self.turns) != 0:
+                    key = self.turns.popleft(); func, args = self.queues[key].popleft()
+                    if len(self.queues[key]) == 0:
+                        del self.queues[key]
+                    else:
+                        self.turns.append(key)
+                    running[executor.submit(func, *args)] = key
+                if len(running) == 0:
+                    return
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    try:
+                        yield key, future.result(), None
+                    except Exception as e:
+                        yield key, None, e
+
+# generate records of several accounts, loading all of them on one shared worker pool (each record has 'user' and 'kind' fields)
+def batch_records(usernames, achievements=False, screenshots=False, jobs=NUM_BATCH_JOBS):
+    def load_user(username): # load the library and screenshot filter here too, so failures come back as error records (and don't block the scheduler)
+        user = User(username); user.games_list; user.games_with_screenshots
+        return 'user', user
+    def load_achievements(game, username):
+        try:
+            game.load_achievements(username)
+        except Exception as e:
+            if not is_missing_stats(e):
+                return 'error', (game, e)
+            game.achievements = list()
+        return 'achievements', game
+    def load_screenshots(game, username):
+        try:
+            game.load_screenshots(username)
+        except Exception as e:
+            return 'error', (game, e)
+        return 'screenshots', game
+    scheduler = BatchScheduler(jobs)
+    for username in usernames:
+        scheduler.submit(username, load_user, username)
+    for username, result, e in scheduler.results():
+        if e is not None:
+            yield {'user':username, 'kind':'error', 'error':str(e)}; continue
+        kind, obj = result
+        if kind == 'user':
+            yield {'user':username, 'kind':'profile', 'steamID':obj.username, 'steamID64':obj.steamID64, 'online_state':obj.online_state, 'games':len(obj.games_list), 'games_with_screenshots':len(obj.games_with_screenshots)}
+            for game in obj.games_list:
+                if achievements:
+                    scheduler.submit(username, load_achievements, game, username)
+                if screenshots and game.appID in obj.games_with_screenshots:
+                    scheduler.submit(username, load_screenshots, game, username)
+        elif kind == 'error':
+            yield {'user':username, 'kind':'error', 'appID':obj[0].appID, 'game':obj[0].name, 'error':str(obj[1])}
+        elif kind == 'achievements':
+            for achievement in obj.achievements:
+                yield dict({'user':username, 'kind':'achievement', 'appID':obj.appID, 'game':obj.name}, **achievement.record())
+            obj.achievements = None
+        else:
+            for screenshot in obj.screenshots:
+                yield dict({'user':username, 'kind':'screenshot', 'appID':obj.appID, 'game':obj.name}, **screenshot.record())
+            obj.screenshots = None
+
+# add CLI args shared by all modes
+def add_common_args(parser):
+    parser.add_argument('-j', '--jobs', type=int, default=NUM_DOWNLOAD_JOBS, help="Number of parallel downloads (1 = serial: also the default for the other --*-jobs)")
+    parser.add_argument('--page-jobs', type=int, default=None, help="Number of screenshot list pages loaded in parallel (default: %d)" % NUM_PAGE_JOBS)
+    parser.add_argument('--detail-jobs', type=int, default=None, help="Number of screenshot detail pages loaded in parallel while downloading (default: %d)" % NUM_SHARED_FILE_JOBS)
+    parser.add_argument('--write-jobs', type=int, default=None, help="Number of downloaded screenshots finished (timestamps, manifest) in parallel (default: %d)" % NUM_WRITE_JOBS)
+    parser.add_argument('--no-cache', action='store_true', help="Don't read or write the HTTP response cache (%s)" % CACHE_PATH)
+    parser.add_argument('--refresh', action='store_true', help="Revalidate every cached HTTP response with Steam")
+    parser.add_argument('--max-connections-per-host', type=int, default=None, help="Maximum number of open connections to each host (default: the larger of %d and --jobs)" % MAX_CONNECTIONS_PER_HOST)
+    parser.add_argument('--rate', type=float, default=None, help="Maximum number of HTTP requests per second (across all threads, 0 for unlimited)")
+    parser.add_argument('--profile', action='store_true', help="Print a summary of requests per endpoint class (count, bytes, latency, retries, time per phase) at exit")
+    parser.add_argument('--profile-output', default=None, help="Write the request profile summary to this JSON file at exit")
+    parser.add_argument('--profile-trace', default=None, help="Write every request phase to this Chrome trace file (chrome://tracing) at exit")
+
+# apply CLI args shared by all modes
+def apply_common_args(args):
+    global NUM_DOWNLOAD_JOBS, NUM_PAGE_JOBS, NUM_SHARED_FILE_JOBS, NUM_WRITE_JOBS, CACHE_ENABLED, CACHE_REFRESH
+    stage_jobs = [NUM_PAGE_JOBS, NUM_SHARED_FILE_JOBS, NUM_WRITE_JOBS] if args.jobs != 1 else [1, 1, 1] # '-j 1' is the serial path
+    NUM_PAGE_JOBS, NUM_SHARED_FILE_JOBS, NUM_WRITE_JOBS = [default if jobs is None else jobs for jobs, default in zip([args.page_jobs, args.detail_jobs, args.write_jobs], stage_jobs)]
+    if min(args.jobs, NUM_PAGE_JOBS, NUM_SHARED_FILE_JOBS, NUM_WRITE_JOBS) < 1:
+        error(ERROR_INVALID_NUM_JOBS)
+    NUM_DOWNLOAD_JOBS = args.jobs; CACHE_ENABLED = not args.no_cache; CACHE_REFRESH = args.refresh
+    HTTP_CLIENT.max_connections_per_host = max(MAX_CONNECTIONS_PER_HOST, args.jobs) if args.max_connections_per_host is None else args.max_connections_per_host
+    if HTTP_CLIENT.max_connections_per_host < 1:
+        error(ERROR_INVALID_NUM_CONNECTIONS)
+    if args.rate is not None:
+        HTTP_CLIENT.rate_limiter = RateLimiter(args.rate) if args.rate > 0 else None
+    if args.profile or args.profile_output is not None or args.profile_trace is not None:
+        PROFILER.enable(trace=(args.profile_trace is not None)); atexit_register(PROFILER.finish, args.profile, args.profile_output, args.profile_trace)
+
 # main content
 if __name__ == "__main__":
-    # parse CLI arg (if applicable)
-    username = None
-    if len(argv) > 2 or (len(argv) == 2 and argv[1].lstrip('-').lower() in {'h','help'}):
-        print("USAGE: %s [steam_username]" % argv[0]); exit(1)
-    elif len(argv) == 2:
-        username = argv[1].strip()
+    # run headless export (if applicable)
+    if len(argv) > 1 and argv[1] == 'export':
+        parser = ArgumentParser(prog="%s export" % argv[0], description="Export data from a public Steam account as NDJSON/CSV (no dialogs)")
+        parser.add_argument('kind', choices=sorted(EXPORT_FIELDS), help="Kind of records to export")
+        parser.add_argument('steam_username', help="Steam username")
+        parser.add_argument('-f', '--format', choices=EXPORT_FORMATS, default=EXPORT_FORMATS[0], help="Output format")
+        parser.add_argument('-o', '--output', default='-', help="Output file ('-' for stdout)")
+        parser.add_argument('-g', '--game', action='append', default=None, help="Only export this game (app ID; can be repeated)")
+        parser.add_argument('--details', action='store_true', help="Include game details (library export only)")
+        add_common_args(parser)
+        args = parser.parse_args(argv[2:]); apply_common_args(args); MESSAGE_STREAM = stderr
+        out = stdout if args.output == '-' else open(args.output, 'w', newline='')
+        try:
+            export(args.kind, args.steam_username.strip(), out, fmt=args.format, app_ids=args.game, details=args.details, jobs=args.jobs)
+        except LoadError as e:
+            error(str(e))
+        except BrokenPipeError:
+            exit_broken_pipe()
+        exit(0)
+
+    # run headless screenshot sync (if applicable)
+    if len(argv) > 1 and argv[1] == 'sync':
+        parser = ArgumentParser(prog="%s sync" % argv[0], description="Download new screenshots of a public Steam account into a folder (no dialogs)")
+        parser.add_argument('steam_username', help="Steam username")
+        parser.add_argument('destination', help="Destination folder (keeps a manifest of downloaded screenshots in %s)" % MANIFEST_FILENAME)
+        parser.add_argument('-g', '--game', action='append', default=None, help="Only sync this game (app ID; can be repeated)")
+        add_common_args(parser)
+        args = parser.parse_args(argv[2:]); apply_common_args(args)
+        makedirs(args.destination, exist_ok=True)
+        try:
+            num_failed = sync(args.steam_username.strip(), abspath(expanduser(args.destination)), app_ids=args.game, jobs=args.jobs)
+        except LoadError as e:
+            error(str(e))
+        exit(int(num_failed != 0))
+
+    # run headless screenshot archive export (if applicable)
+    if len(argv) > 1 and argv[1] == 'archive':
+        parser = ArgumentParser(prog="%s archive" % argv[0], description="Stream all screenshots of a public Steam account into one tar/zip archive, with posted dates as modification times (no dialogs)")
+        parser.add_argument('steam_username', help="Steam username")
+        parser.add_argument('-o', '--output', default='-', help="Output archive ('-' for stdout)")
+        parser.add_argument('-f', '--format', choices=ARCHIVE_FORMATS, default=None, help="Archive format (default: from the output file extension, or tar)")
+        parser.add_argument('-g', '--game', action='append', default=None, help="Only archive this game (app ID; can be repeated)")
+        add_common_args(parser)
+        args = parser.parse_args(argv[2:]); apply_common_args(args); MESSAGE_STREAM = stderr
+        fmt = args.format
+        if fmt is None:
+            fmt = 'zip' if args.output.lower().endswith('.zip') else 'tar'
+        out = stdout.buffer if args.output == '-' else open(args.output, 'wb')
+        try:
+            num_failed = archive_screenshots(args.steam_username.strip(), out, fmt=fmt, app_ids=args.game, jobs=args.jobs); out.flush()
+        except LoadError as e:
+            error(str(e))
+        except BrokenPipeError:
+            exit_broken_pipe()
+        exit(int(num_failed != 0))
+
+    # run headless multi-account batch (if applicable)
+    if len(argv) > 1 and argv[1] == 'batch':
+        parser = ArgumentParser(prog="%s batch" % argv[0], description="Load several public Steam accounts on one shared worker pool and export NDJSON/CSV records (no dialogs)", epilog="Requests are limited to %g per second unless --rate is given" % BATCH_RATE)
+        parser.add_argument('steam_usernames', nargs='*', help="Steam usernames")
+        parser.add_argument('-u', '--users', default=None, help="File with one Steam username per line")
+        parser.add_argument('-a', '--achievements', action='store_true', help="Also export achievements of every game")
+        parser.add_argument('-s', '--screenshots', action='store_true', help="Also export screenshot lists of every game")
+        parser.add_argument('-f', '--format', choices=EXPORT_FORMATS, default=EXPORT_FORMATS[0], help="Output format")
+        parser.add_argument('-o', '--output', default='-', help="Output file ('-' for stdout)")
+        parser.add_argument('-w', '--workers', type=int, default=NUM_BATCH_JOBS, help="Number of workers in the shared pool")
+        add_common_args(parser)
+        args = parser.parse_args(argv[2:]); apply_common_args(args); MESSAGE_STREAM = stderr
+        if args.rate is None:
+            HTTP_CLIENT.rate_limiter = RateLimiter(BATCH_RATE, BATCH_BURST)
+        usernames = [username.strip() for username in args.steam_usernames]
+        if args.users is not None:
+            with open(args.users) as f:
+                usernames += [l.strip() for l in f if l.strip() != '']
+        if len(usernames) == 0:
+            error(ERROR_INVALID_USERNAME)
+        if args.workers < 1:
+            error(ERROR_INVALID_NUM_JOBS)
+        out = stdout if args.output == '-' else open(args.output, 'w', newline='')
+        num_errors = 0
+        try:
+            writer = RecordWriter(out, args.format, BATCH_FIELDS)
+            for record in batch_records(usernames, achievements=args.achievements, screenshots=args.screenshots, jobs=args.workers):
+                writer.write(record); num_errors += (record['kind'] == 'error')
+        except BrokenPipeError:
+            exit_broken_pipe()
+        exit(int(num_errors != 0))
+
+    # run headless library database query (if applicable)
+    if len(argv) > 1 and argv[1] == 'library':
+        parser = ArgumentParser(prog="%s library" % argv[0], description="Update a local database of game details from a public Steam account (only loading new or old games), then export the games matching all filters as NDJSON/CSV (no dialogs)")
+        parser.add_argument('steam_username', nargs='?', default=None, help="Steam username (optional with --offline: query every stored game)")
+        parser.add_argument('--offline', action='store_true', help="Don't contact Steam (only query the database)")
+        parser.add_argument('--db', default=LIBRARY_DB_PATH, help="Library database file")
+        parser.add_argument('--max-age', type=float, default=LIBRARY_DB_MAX_AGE / 86400, help="Reload details of games stored more than this many days ago")
+        for kind in LIBRARY_DB_TAG_KINDS:
+            parser.add_argument('--%s' % kind, action='append', default=None, help="Only games with this %s (case-insensitive; can be repeated)" % kind)
+        parser.add_argument('--max-price', type=float, default=None, help="Only games costing at most this much (in the store currency)")
+        parser.add_argument('--controller-support', choices=LIBRARY_DB_CONTROLLER_SUPPORT, default=None, help="Only games with this controller support")
+        parser.add_argument('--name', default=None, help="Only games whose name contains this")
+        parser.add_argument('-f', '--format', choices=EXPORT_FORMATS, default=EXPORT_FORMATS[0], help="Output format")
+        parser.add_argument('-o', '--output', default='-', help="Output file ('-' for stdout)")
+        add_common_args(parser)
+        args = parser.parse_args(argv[2:]); apply_common_args(args); MESSAGE_STREAM = stderr
+        username = None if args.steam_username is None else args.steam_username.strip()
+        if username is None and not args.offline:
+            error(ERROR_INVALID_USERNAME)
+        db = LibraryDatabase(args.db)
+        if not args.offline:
+            try:
+                update_library_db(User(username), db, max_age=86400 * args.max_age, jobs=args.jobs)
+            except LoadError as e:
+                error(str(e))
+        tags = {kind:getattr(args, kind) for kind in LIBRARY_DB_TAG_KINDS if getattr(args, kind) is not None}
+        out = stdout if args.output == '-' else open(args.output, 'w', newline='')
+        try:
+            writer = RecordWriter(out, args.format, EXPORT_FIELDS['library'])
+            for record in db.query(username=username, tags=tags, max_price=args.max_price, controller_support=args.controller_support, name=args.name):
+                writer.write(record)
+        except BrokenPipeError:
+            exit_broken_pipe()
+        exit(0)
+
+    # parse CLI args (if applicable)
+    parser = ArgumentParser(description="SteamTools v%s" % VERSION, epilog="Run '%s export -h', '%s sync -h', '%s archive -h', '%s batch -h', or '%s library -h' for headless modes" % (argv[0], argv[0], argv[0], argv[0], argv[0]))
+    parser.add_argument('steam_username', nargs='?', default=None, help="Steam username")
+    parser.add_argument('--prefetch-details', action='store_true', help="Load details of every game in the library in the background")
+    add_common_args(parser)
+    args = parser.parse_args(); apply_common_args(args); username = args.steam_username
+    if username is not None:
+        username = username.strip()
 
     # show welcome message and prompt user for Steam username
     if username is None:
-        APPS['welcome'].run(); username = ''
+        APPS['welcome']().run(); username = ''; user_prompt_app = APPS['user_prompt']()
         while True:
-            username = APPS['user_prompt'].run()
+            username = user_prompt_app.run()
             if username is None:
                 break
             username = username.strip()
@@ -568,6 +2607,12 @@ if __name__ == "__main__":
         exit(1)
 
     # run app
-    user = User(username); curr_view = user.view_main
+    try:
+        user = User(username)
+    except LoadError as e:
+        error_app(str(e))
+    curr_view = user.view_main
+    if args.prefetch_details:
+        user.prefetch_details()
     while curr_view is not None:
         curr_view = curr_view()
@@ -0,0 +1,462 @@
+#! /usr/bin/env python3
+'''
+SteamTools benchmarks (Niema Moshiri 2021)
+'''
+
+# imports
+from argparse import ArgumentParser
+from datetime import datetime
+from glob import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps as jdumps, loads as jloads
+from os import devnull
+from os.path import abspath, dirname, isfile
+from random import Random
+from resource import RUSAGE_SELF, getrusage
+from subprocess import run
+from sys import argv, executable, exit
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+from time import perf_counter, sleep
+from urllib.parse import parse_qs, urlsplit
+from xml.etree import ElementTree
+import SteamTools
+
+# useful constants
+NUM_REPEATS = 5
+NUM_FILLER_LINES = 3000 # real detail pages are a few thousand lines long
+NUM_GAMES = 10000
+NUM_ACHIEVEMENTS_PER_GAME = 50
+NUM_IMPORT_REPEATS = 10
+NUM_TOP_IMPORTS = 10
+TUI_MODULES = ['prompt_toolkit', 'filedate'] # only the interactive app should import these
+NETWORK_SCENARIOS = ['user', 'achievements', 'appdetails', 'screenshots', 'details', 'download']
+NETWORK_SCENARIO_UNITS = {'user':'users', 'achievements':'games', 'appdetails':'games', 'screenshots':'screenshots', 'details':'screenshots', 'download':'screenshots'}
+MOCK_USERNAME = 'synthetic'
+MOCK_LATENCY = 20 # milliseconds per response
+MOCK_NUM_GAMES = 200
+MOCK_NUM_SCREENSHOTS = 500
+MOCK_IMAGE_SIZE = 500000 # bytes
+MOCK_WRITE_CHUNK_SIZE = 64 * 1024
+MOCK_FIXTURES = { # recorded documents served instead of the synthetic ones if found in the fixtures folder
+    'profile': 'profile.xml',
+    'games': 'games.xml',
+    'achievements': 'achievements.xml',
+    'appdetails': 'appdetails.json',
+    'filter': 'filter.html',
+    'image': 'image.jpg',
+}
+FIXTURE_PATTERNS = { # saved pages in a fixtures folder (e.g. from 'curl -o sharedfile_1.html <URL>')
+    'sharedfile': 'sharedfile_*.html',
+    'grid': 'grid_*.html',
+    'filter': 'filter_*.html',
+}
+
+# legacy parser of shared file detail pages (SteamTools v0.0.2), used as the reference for output and speed
+def legacy_parse_shared_file(page):
+    html_lines = page.decode().splitlines(); data = dict()
+    details_stats_names = list(); details_stats_vals = list()
+    for i, l in enumerate(html_lines):
+        if 'letterbox=false' in l:
+            data['image_url'] = l.split('href="')[1].split('"')[0].strip()
+        elif 'detailsStatsContainerLeft' in l:
+            for j, jl in enumerate(html_lines[i+1:]):
+                jls = jl.strip()
+                if jls == '':
+                    continue
+                elif jls == "</div>":
+                    break
+                details_stats_names.append(jl.split('<div class="detailsStatLeft">')[1].split('</div>')[0].strip())
+        elif 'detailsStatsContainerRight' in l:
+            for j, jl in enumerate(html_lines[i+1:]):
+                jls = jl.strip()
+                if jls == '':
+                    continue
+                elif jl.strip() == "</div>":
+                    break
+                details_stats_vals.append(jl.split('<div class="detailsStatRight">')[1].split('</div>')[0].strip())
+    for i in range(len(details_stats_names)):
+        data[details_stats_names[i]] = details_stats_vals[i]
+    return data
+
+# legacy parser of screenshot grid pages (SteamTools v0.0.2, patched to drop thousands separators from the total)
+# (Steam shows totals over 999 as e.g. '1,234', which v0.0.2 failed to parse, so unpatched it couldn't be compared on synthetic or recorded pages)
+def legacy_parse_grid(page):
+    html_lines = page.decode().splitlines()
+    IDs = [int(l.split('?id=')[1].split('"')[0]) for l in html_lines if 'filedetails' in l and '?id=' in l]
+    return IDs, int([l for l in html_lines if 'Showing ' in l][0].split(' of ')[1].split('<')[0].replace(',',''))
+
+# legacy parser of the screenshots filter page (SteamTools v0.0.2)
+def legacy_parse_filter(page):
+    return {l.split("'appid': '")[1].split("'")[0] for l in page.decode().splitlines() if 'javascript:SelectSharedFilesContentFilter' in l and 'appid' in l}
+
+# legacy achievement (SteamTools v0.0.2: one __dict__ per object)
+class LegacyAchievement:
+    def __init__(self, achievement):
+        self.unlock_time = None
+        for curr in achievement:
+            if curr.tag == 'iconClosed':
+                self.url_icon_unlocked = curr.text.strip()
+            elif curr.tag == 'iconOpen':
+                self.url_icon_locked = curr.text.strip()
+            elif curr.tag == 'name':
+                self.name = curr.text.strip()
+            elif curr.tag == 'apiname':
+                self.name_api = curr.text.strip()
+            elif curr.tag == 'description':
+                self.description = curr.text.strip()
+            elif curr.tag == 'unlockTimestamp':
+                self.unlock_time = datetime.utcfromtimestamp(int(curr.text))
+
+# legacy game (SteamTools v0.0.2: one __dict__ per object)
+class LegacyGame:
+    def __init__(self, game):
+        data = dict()
+        for item in game:
+            data[item.tag] = item.text
+        self.name = data['name']; self.appID = data['appID']; self.details = None; self.achievements = None; self.screenshots = None
+    def __lt__(self, o):
+        return self.name.lower() < o.name.lower()
+
+# legacy loaders (SteamTools v0.0.2: build the whole tree first)
+def legacy_parse_games_xml(xml):
+    xml_games = [curr for curr in ElementTree.fromstring(xml) if curr.tag == 'games'][0]
+    return sorted(LegacyGame(xml_game) for xml_game in xml_games)
+def legacy_parse_achievements_xml(xml):
+    xml_achievements = [curr for curr in ElementTree.fromstring(xml) if curr.tag == 'achievements'][0]
+    return [LegacyAchievement(curr) for curr in xml_achievements]
+
+# filler lines resembling the markup around the interesting parts of a Steam page
+def filler_lines(num_lines):
+    return ['\t\t<div class="responsive_page_menu_ctn"><a class="menuitem" href="https://steamcommunity.com/?id=%d">Item %d</a></div>' % (i, i) if i % 7 == 0 else '\t\t\t' for i in range(num_lines)]
+
+# synthetic shared file detail page
+def synthetic_shared_file_page(ID, num_filler_lines=NUM_FILLER_LINES, image_url=None, file_size='1.234 MB'):
+    if image_url is None:
+        image_url = "https://steamuserimages-a.akamaihd.net/ugc/%d/ABCDEF/" % ID
+    lines = ['<!DOCTYPE html>', '<html>'] + filler_lines(num_filler_lines // 2)
+    lines += ['\t\t<a href="%s" target="_blank" onclick="return ShowModalContent(this.href, \'letterbox=false\');">' % image_url]
+    lines += ['\t<div class="detailsStatsContainerLeft">', '\t\t<div class="detailsStatLeft">File Size</div>', '\t\t<div class="detailsStatLeft">Posted</div>', '\t\t<div class="detailsStatLeft">Size</div>', '', '\t</div>']
+    lines += ['\t<div class="detailsStatsContainerRight">', '\t\t<div class="detailsStatRight">%s</div>' % file_size, '\t\t<div class="detailsStatRight">Mar %d, 2020 @ 4:05pm</div>' % (ID % 28 + 1), '\t\t<div class="detailsStatRight">1920 x 1080</div>', '', '\t</div>']
+    lines += filler_lines(num_filler_lines // 2) + ['</html>']
+    return '\r\n'.join(lines).encode()
+
+# synthetic screenshot grid page (IDs are consecutive, starting at 'first_ID' on the first page)
+def synthetic_grid_page(page_num, per_page=50, total=10000, num_filler_lines=NUM_FILLER_LINES, first_ID=1):
+    start = (page_num-1)*per_page; end = min(page_num*per_page, total)
+    lines = ['<html>'] + filler_lines(num_filler_lines // 2)
+    lines += ['\t<div class="giantNumber">Showing %d - %d of %s</div>' % (start+1, end, '{:,}'.format(total))]
+    lines += ['\t<a href="https://steamcommunity.com/sharedfiles/filedetails/?id=%d" class="profile_media_item">' % (first_ID+i) for i in range(start, end)]
+    lines += filler_lines(num_filler_lines // 2) + ['</html>']
+    return '\r\n'.join(lines).encode()
+
+# synthetic screenshots filter page
+def synthetic_filter_page(num_games=200, num_filler_lines=NUM_FILLER_LINES):
+    lines = ['<html>'] + filler_lines(num_filler_lines // 2)
+    lines += ['\t<div class="sectionTab" onclick="javascript:SelectSharedFilesContentFilter({ \'appid\': \'%d\' });">Game %d</div>' % (i, i) for i in range(num_games)]
+    lines += filler_lines(num_filler_lines // 2) + ['</html>']
+    return '\r\n'.join(lines).encode()
+
+# synthetic games list XML document
+def synthetic_games_xml(num_games=NUM_GAMES):
+    games = ''.join('<game><appID>%d</appID><name><![CDATA[Synthetic Game %d]]></name><logo><![CDATA[https://cdn.cloudflare.steamstatic.com/steam/apps/%d/capsule_184x69.jpg]]></logo><storeLink><![CDATA[https://steamcommunity.com/app/%d]]></storeLink><hoursOnRecord>%d.%d</hoursOnRecord><statsLink><![CDATA[https://steamcommunity.com/id/synthetic/stats/%d]]></statsLink><globalStatsLink><![CDATA[https://steamcommunity.com/stats/%d/achievements/]]></globalStatsLink></game>' % (i, i, i, i, i % 1000, i % 10, i, i) for i in range(num_games))
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?><gamesList><steamID64>76561197960287930</steamID64><steamID><![CDATA[synthetic]]></steamID><games>%s</games></gamesList>' % games).encode()
+
+# synthetic game stats XML document
+def synthetic_achievements_xml(appID, num_achievements=NUM_ACHIEVEMENTS_PER_GAME):
+    achievements = ''.join('<achievement closed="%d"><iconClosed><![CDATA[https://cdn.cloudflare.steamstatic.com/steamcommunity/public/images/apps/%d/%040x.jpg]]></iconClosed><iconOpen><![CDATA[https://cdn.cloudflare.steamstatic.com/steamcommunity/public/images/apps/%d/%040x.jpg]]></iconOpen><name><![CDATA[Achievement %d]]></name><apiname><![CDATA[ACH_%d]]></apiname><description><![CDATA[Do the synthetic thing number %d in game %d]]></description>%s</achievement>' % (i % 2, appID, i, appID, i+1, i, i, i, appID, '<unlockTimestamp>%d</unlockTimestamp>' % (1600000000 + appID*100 + i) if i % 2 == 0 else '') for i in range(num_achievements))
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?><playerstats><privacyState>public</privacyState><visibilityState>3</visibilityState><game><gameName><![CDATA[Synthetic Game %d]]></gameName></game><achievements>%s</achievements></playerstats>' % (appID, achievements)).encode()
+
+# synthetic profile XML document
+def synthetic_profile_xml(username=MOCK_USERNAME):
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?><profile><steamID64>76561197960287930</steamID64><steamID><![CDATA[%s]]></steamID><onlineState>online</onlineState><stateMessage><![CDATA[Online]]></stateMessage><avatarFull><![CDATA[https://avatars.cloudflare.steamstatic.com/synthetic_full.jpg]]></avatarFull><memberSince>January 1, 2010</memberSince><location><![CDATA[Synthetic City]]></location><realname><![CDATA[Synthetic User]]></realname></profile>' % username).encode()
+
+# synthetic store API app details JSON document
+def synthetic_appdetails_json(appID):
+    return jdumps({appID:{'success':True, 'data':{'name':'Synthetic Game %s' % appID, 'developers':['Synthetic Developer'], 'publishers':['Synthetic Publisher'], 'release_date':{'coming_soon':False, 'date':'1 Jan, 2020'}, 'price_overview':{'currency':'USD', 'final':999, 'final_formatted':'$9.99'}, 'genres':[{'id':'1', 'description':'Action'}, {'id':'25', 'description':'Adventure'}], 'categories':[{'id':2, 'description':'Single-player'}, {'id':22, 'description':'Steam Achievements'}], 'controller_support':'full', 'supported_languages':'English<strong>*</strong>, French, German<br><strong>*</strong>languages with full audio support', 'achievements':{'total':NUM_ACHIEVEMENTS_PER_GAME}, 'detailed_description':'Synthetic description. ' * 200}}}).encode()
+
+# local stand-in for Steam serving synthetic (or recorded) pages, with configurable latency, bandwidth, and error rate
+class MockSteamServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # constructor ('bandwidth' is in MB/s per response, 0 for unlimited; 'error_rate' is the fraction of requests answered with HTTP 503; 'chunked' sends bodies with chunked transfer encoding)
+    def __init__(self, latency=MOCK_LATENCY, bandwidth=0, error_rate=0, num_games=MOCK_NUM_GAMES, num_screenshots=MOCK_NUM_SCREENSHOTS, image_size=MOCK_IMAGE_SIZE, fixtures=None, seed=0, chunked=False):
+        super().__init__(('127.0.0.1', 0), MockSteamHandler)
+        self.latency = latency / 1000; self.bandwidth = bandwidth * 1000000; self.error_rate = error_rate; self.chunked = chunked
+        self.num_games = num_games; self.num_screenshots = num_screenshots; self.image_size = image_size
+        self.random = Random(seed); self.lock = Lock(); self.reset()
+        self.fixtures = dict()
+        if fixtures is not None:
+            for kind, fn in MOCK_FIXTURES.items():
+                if isfile('%s/%s' % (fixtures, fn)):
+                    with open('%s/%s' % (fixtures, fn), 'rb') as f:
+                        self.fixtures[kind] = f.read()
+        self.image = self.fixtures.get('image', bytes(i % 251 for i in range(image_size)))
+        self.url = 'http://127.0.0.1:%d' % self.server_address[1]
+        self.image_url = 'http://localhost:%d' % self.server_address[1] # images come from another host (like Steam's CDN), so they get their own connections
+
+    # reset request counters
+    def reset(self):
+        with self.lock:
+            self.num_requests = 0; self.num_errors = 0; self.num_bytes = 0; self.num_connections = 0
+
+    # decide whether to inject an error into a request (and count it)
+    def count_request(self):
+        with self.lock:
+            self.num_requests += 1; failed = self.random.random() < self.error_rate
+            if failed:
+                self.num_errors += 1
+            return failed
+
+    # start serving in a background thread
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start(); return self
+
+# request handler of the mock Steam server
+class MockSteamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True # otherwise headers and body are sent in separate packets and delayed ACKs add ~40 ms to each response
+
+    # count each new connection
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.num_connections += 1
+
+    # don't log every request
+    def log_message(self, *args):
+        pass
+
+    # send a response (after the configured latency, throttled to the configured bandwidth)
+    def send(self, body, content_type='text/html; charset=utf-8', code=200):
+        sleep(self.server.latency)
+        self.send_response(code); self.send_header('Content-Type', content_type)
+        self.send_header(*(('Transfer-Encoding', 'chunked') if self.server.chunked else ('Content-Length', str(len(body))))); self.end_headers()
+        for i in range(0, len(body), MOCK_WRITE_CHUNK_SIZE):
+            chunk = body[i:i+MOCK_WRITE_CHUNK_SIZE]; self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if self.server.chunked else chunk)
+            if self.server.bandwidth != 0:
+                sleep(len(chunk) / self.server.bandwidth)
+        if self.server.chunked:
+            self.wfile.write(b'0\r\n\r\n')
+        with self.server.lock:
+            self.server.num_bytes += len(body)
+
+    # send a redirect to another path on this server
+    def redirect(self, path, code=302):
+        sleep(self.server.latency)
+        self.send_response(code); self.send_header('Location', path); self.send_header('Content-Length', '0'); self.end_headers()
+
+    # get a recorded document (if there is one) or a synthetic one
+    def document(self, kind, synthetic):
+        return self.server.fixtures[kind] if kind in self.server.fixtures else synthetic()
+
+    # handle a GET request
+    def do_GET(self):
+        server = self.server; url = urlsplit(self.path); query = parse_qs(url.query); parts = url.path.strip('/').split('/')
+        if server.count_request():
+            return self.send(b'<html>Service Unavailable</html>', code=503)
+        if parts[0] == 'profiles': # Steam redirects numeric profile URLs of users with a custom URL
+            return self.redirect('/id/%s' % '/'.join(parts[1:]) + ('?' + url.query if url.query else ''))
+        elif parts[0] == 'id' and len(parts) == 2:
+            return self.send(self.document('profile', lambda: synthetic_profile_xml(parts[1])), 'text/xml; charset=utf-8')
+        elif parts[0] == 'id' and parts[2:] == ['games']:
+            return self.send(self.document('games', lambda: synthetic_games_xml(server.num_games)), 'text/xml; charset=utf-8')
+        elif parts[0] == 'id' and parts[2:3] == ['stats']:
+            return self.send(self.document('achievements', lambda: synthetic_achievements_xml(int(parts[3]))), 'text/xml; charset=utf-8')
+        elif parts[0] == 'id' and parts[2:] == ['screenshots'] and 'appid' not in query:
+            return self.send(self.document('filter', lambda: synthetic_filter_page(server.num_games)))
+        elif parts[0] == 'id' and parts[2:] == ['screenshots']:
+            appID = int(query['appid'][0]); page_num = int(query['p'][0])
+            return self.send(synthetic_grid_page(page_num, total=server.num_screenshots, first_ID=appID*1000000))
+        elif parts == ['sharedfiles', 'filedetails']:
+            ID = int(query['id'][0])
+            return self.send(synthetic_shared_file_page(ID, image_url='%s/images/%d.jpg' % (server.image_url, ID), file_size='%d B' % len(server.image)))
+        elif parts[0] == 'images':
+            return self.send(server.image, 'image/jpeg')
+        elif parts[0] == 'appdetails':
+            appID = query['appids'][0]
+            if 'appdetails' in server.fixtures: # recorded document of some other game, so relabel it
+                return self.send(jdumps({appID:list(jloads(server.fixtures['appdetails']).values())[0]}).encode(), 'application/json')
+            return self.send(synthetic_appdetails_json(appID), 'application/json')
+        self.send(b'<html>Not Found</html>', code=404)
+
+# get a percentile of a sorted list
+def percentile(values, p):
+    return values[min(len(values)-1, int(p * len(values)))] if len(values) != 0 else float('nan')
+
+# run a scenario against the mock server at 'url' in this process, and print its results as a JSON line (for 'bench_network')
+def measure_network(scenario, url, num_games=MOCK_NUM_GAMES, num_screenshots=MOCK_NUM_SCREENSHOTS, jobs=SteamTools.NUM_DOWNLOAD_JOBS):
+    SteamTools.STEAM_COMMUNITY_BASE_URL = url + '/id'; SteamTools.STEAM_APP_DETAILS_BASE_URL = url + '/appdetails?appids='; SteamTools.STEAM_SHARED_FILES_BASE_URL = url + '/sharedfiles/filedetails?id='
+    SteamTools.CACHE_ENABLED = False; SteamTools.RATE_LIMITERS = dict() # measure the network stack, not the cache or the store API rate limit
+    SteamTools.HTTP_CLIENT.max_connections_per_host = max(SteamTools.MAX_CONNECTIONS_PER_HOST, jobs) # as the CLI does
+    SteamTools.MESSAGE_STREAM = open(devnull, 'w')
+
+    # time every request (until its response headers arrive)
+    SteamTools.PROFILER.enable()
+
+    # set up the scenario (offline) and run it
+    games = SteamTools.parse_games_xml(synthetic_games_xml(num_games))
+    screenshots = [SteamTools.SharedFile(int(games[0].appID)*1000000 + i) for i in range(num_screenshots)]
+    start = perf_counter()
+    with TemporaryDirectory() as destination:
+        if scenario == 'user':
+            user = SteamTools.User(MOCK_USERNAME); user.games_list; user.games_with_screenshots; num_items = 1
+        elif scenario == 'achievements':
+            list(SteamTools.parallel_map(lambda game: game.load_achievements(MOCK_USERNAME), games, jobs)); num_items = len(games)
+        elif scenario == 'appdetails':
+            list(SteamTools.parallel_map(SteamTools.Game.load_details, games, jobs)); num_items = len(games)
+        elif scenario == 'screenshots':
+            games[0].load_screenshots(MOCK_USERNAME); num_items = len(games[0].screenshots)
+        elif scenario == 'details':
+            list(SteamTools.parallel_map(SteamTools.SharedFile.load_data, screenshots, jobs)); num_items = len(screenshots)
+        elif scenario == 'download':
+            failed = SteamTools.download_shared_files(screenshots, destination, jobs=jobs); num_items = len(screenshots) - len(failed)
+        elapsed = perf_counter() - start
+    latencies = sorted(latency for stats in SteamTools.PROFILER.endpoints.values() for latency in stats['latencies'])
+    print(jdumps({'elapsed':elapsed, 'items':num_items, 'p50':percentile(latencies, 0.5), 'p99':percentile(latencies, 0.99), 'peak_rss':getrusage(RUSAGE_SELF).ru_maxrss, 'http':SteamTools.HTTP_CLIENT.stats()}))
+
+# benchmark the network stack against a local mock Steam server (each scenario runs in a fresh process so peak RSS is per scenario)
+def bench_network(scenarios=NETWORK_SCENARIOS, latency=MOCK_LATENCY, bandwidth=0, error_rate=0, num_games=MOCK_NUM_GAMES, num_screenshots=MOCK_NUM_SCREENSHOTS, image_size=MOCK_IMAGE_SIZE, jobs=SteamTools.NUM_DOWNLOAD_JOBS, fixtures=None, seed=0, chunked=False):
+    server = MockSteamServer(latency=latency, bandwidth=bandwidth, error_rate=error_rate, num_games=num_games, num_screenshots=num_screenshots, image_size=image_size, fixtures=fixtures, seed=seed, chunked=chunked).start()
+    print("Mock server: latency %d ms, bandwidth %s, error rate %.1f%%, %d jobs%s\n" % (latency, 'unlimited' if bandwidth == 0 else '%g MB/s' % bandwidth, error_rate*100, jobs, ', chunked' if chunked else ''))
+    print("%-12s %8s %-12s %8s %8s %10s %8s %8s %8s %8s %8s %8s %10s" % ('scenario', 'items', 'unit', 'time (s)', 'req/s', 'items/s', 'MB/s', 'p50 (ms)', 'p99 (ms)', 'errors', 'conns', 'reused', 'peak (MB)'))
+    for scenario in scenarios:
+        server.reset()
+        result = run([executable, abspath(__file__), 'network', '--scenario', scenario, '--url', server.url, '--games', str(num_games), '--screenshots', str(num_screenshots), '--jobs', str(jobs)], capture_output=True, text=True, check=True)
+        result = jloads(result.stdout.strip().splitlines()[-1]); elapsed = result['elapsed']
+        print("%-12s %8d %-12s %8.2f %8.1f %10.1f %8.2f %8.1f %8.1f %8d %8d %8d %10.1f" % (scenario, result['items'], NETWORK_SCENARIO_UNITS[scenario], elapsed, server.num_requests/elapsed, result['items']/elapsed, server.num_bytes/1000000/elapsed, result['p50']*1000, result['p99']*1000, server.num_errors, result['http']['connections_opened'], result['http']['connections_reused'], result['peak_rss']/1024))
+    server.shutdown()
+
+# load a synthetic account (all games and all of their achievements) and report peak RSS (run in a fresh process per mode)
+def measure_memory(mode, num_games=NUM_GAMES, num_achievements=NUM_ACHIEVEMENTS_PER_GAME):
+    if mode == 'legacy':
+        parse_games_xml = legacy_parse_games_xml; parse_achievements_xml = legacy_parse_achievements_xml
+    else:
+        parse_games_xml = SteamTools.parse_games_xml; parse_achievements_xml = SteamTools.parse_achievements_xml
+    baseline_rss = getrusage(RUSAGE_SELF).ru_maxrss; start = perf_counter()
+    games = parse_games_xml(synthetic_games_xml(num_games))
+    for game in games:
+        game.achievements = parse_achievements_xml(synthetic_achievements_xml(int(game.appID), num_achievements))
+    elapsed = perf_counter() - start; peak_rss = getrusage(RUSAGE_SELF).ru_maxrss
+    print("%-8s %8d %12d %10.2f %16.1f %16.1f" % (mode, len(games), sum(len(game.achievements) for game in games), elapsed, peak_rss/1024, (peak_rss-baseline_rss)/1024))
+
+# benchmark memory use of loading a large account (legacy vs. streaming loaders with __slots__ models)
+def bench_memory(num_games=NUM_GAMES, num_achievements=NUM_ACHIEVEMENTS_PER_GAME):
+    print("%-8s %8s %12s %10s %16s %16s" % ('loader', 'games', 'achievements', 'time (s)', 'peak RSS (MB)', 'growth (MB)'))
+    for mode in ['legacy', 'new']:
+        run([executable, argv[0], 'memory', '--mode', mode, '--games', str(num_games), '--achievements', str(num_achievements)], check=True)
+
+# load pages to parse (saved fixtures if a folder is given, otherwise synthetic pages)
+def load_pages(fixtures=None):
+    if fixtures is not None:
+        pages = dict()
+        for kind, pattern in FIXTURE_PATTERNS.items():
+            pages[kind] = list()
+            for fn in sorted(glob('%s/%s' % (fixtures, pattern))):
+                with open(fn, 'rb') as f:
+                    pages[kind].append(f.read())
+        return pages
+    return {
+        'sharedfile': [synthetic_shared_file_page(ID) for ID in range(50)],
+        'grid': [synthetic_grid_page(page_num) for page_num in range(1, 51)],
+        'filter': [synthetic_filter_page() for _ in range(10)],
+    }
+
+# time a function over a list of pages (best of several repeats), returned in seconds
+def time_parser(func, pages, repeats=NUM_REPEATS):
+    best = float('inf')
+    for _ in range(repeats):
+        start = perf_counter()
+        for page in pages:
+            func(page)
+        best = min(best, perf_counter() - start)
+    return best
+
+# benchmark the page parsers against the legacy parsers (and check that their output is identical)
+def bench_parsers(fixtures=None, repeats=NUM_REPEATS):
+    parsers = {
+        'sharedfile': (legacy_parse_shared_file, SteamTools.SharedFileParser.parse),
+        'grid': (legacy_parse_grid, SteamTools.ScreenshotGridParser.parse),
+        'filter': (legacy_parse_filter, SteamTools.ScreenshotFilterParser.parse),
+    }
+    pages = load_pages(fixtures)
+    print("%-12s %6s %10s %12s %12s %8s" % ('parser', 'pages', 'MB', 'legacy (ms)', 'new (ms)', 'speedup'))
+    for kind, (legacy_func, new_func) in parsers.items():
+        if len(pages[kind]) == 0:
+            continue
+        for page in pages[kind]:
+            assert legacy_func(page) == new_func(page), "Parser output differs from legacy parser (%s)" % kind
+        legacy_time = time_parser(legacy_func, pages[kind], repeats); new_time = time_parser(new_func, pages[kind], repeats)
+        num_mb = sum(len(page) for page in pages[kind]) / 1000000
+        print("%-12s %6d %10.2f %12.2f %12.2f %7.2fx" % (kind, len(pages[kind]), num_mb, legacy_time*1000, new_time*1000, legacy_time/new_time))
+
+# measure 'import SteamTools' in a fresh interpreter with 'python -X importtime', returned as a {module: (self_us, cumulative_us)} dict
+def measure_import():
+    result = run([executable, '-X', 'importtime', '-c', 'import SteamTools'], cwd=dirname(abspath(__file__)), capture_output=True, text=True, check=True)
+    modules = dict()
+    for l in result.stderr.splitlines():
+        if not l.startswith('import time:') or 'self [us]' in l:
+            continue
+        self_us, cumulative_us, module = l[len('import time:'):].split('|')
+        modules[module.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+# benchmark import time of SteamTools (fails if it imports a TUI module, or if the median is over 'max_ms')
+def bench_importtime(repeats=NUM_IMPORT_REPEATS, max_ms=None):
+    runs = [measure_import() for _ in range(repeats)]
+    totals = sorted(modules['SteamTools'][1] / 1000 for modules in runs)
+    median = totals[len(totals)//2]
+    print("%-12s %8s %10s %12s %10s" % ('module', 'runs', 'best (ms)', 'median (ms)', 'worst (ms)'))
+    print("%-12s %8d %10.2f %12.2f %10.2f" % ('SteamTools', repeats, totals[0], median, totals[-1]))
+    print("\nSlowest imports (cumulative, last run):")
+    for module, (self_us, cumulative_us) in sorted(runs[-1].items(), key=lambda x: -x[1][1])[1:NUM_TOP_IMPORTS+1]:
+        print("  %-40s %10.2f ms" % (module, cumulative_us/1000))
+    tui_modules = sorted(module for module in runs[-1] if module.split('.')[0] in TUI_MODULES)
+    if len(tui_modules) != 0:
+        exit("Importing SteamTools imported TUI modules: %s" % ', '.join(tui_modules))
+    if max_ms is not None and median > max_ms:
+        exit("Median import time (%.2f ms) is over the limit (%.2f ms)" % (median, max_ms))
+
+# main content
+if __name__ == "__main__":
+    parser = ArgumentParser(description="SteamTools benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    parser_parsers = subparsers.add_parser('parsers', help="HTML page parsers (vs. the legacy parsers)")
+    parser_parsers.add_argument('--fixtures', default=None, help="Folder of saved pages (%s)" % ', '.join(FIXTURE_PATTERNS.values()))
+    parser_parsers.add_argument('--repeats', type=int, default=NUM_REPEATS, help="Number of repeats (best is reported)")
+    parser_memory = subparsers.add_parser('memory', help="Peak RSS of loading a synthetic account's games and achievements")
+    parser_memory.add_argument('--games', type=int, default=NUM_GAMES, help="Number of games")
+    parser_memory.add_argument('--achievements', type=int, default=NUM_ACHIEVEMENTS_PER_GAME, help="Number of achievements per game")
+    parser_memory.add_argument('--mode', choices=['legacy', 'new'], default=None, help="Only measure one loader (in this process)")
+    parser_importtime = subparsers.add_parser('importtime', help="Import time of SteamTools (via 'python -X importtime')")
+    parser_importtime.add_argument('--repeats', type=int, default=NUM_IMPORT_REPEATS, help="Number of repeats")
+    parser_importtime.add_argument('--max-ms', type=float, default=None, help="Fail if the median import time is over this many milliseconds")
+    parser_network = subparsers.add_parser('network', help="User, screenshot, detail, and download scenarios against a local mock Steam server")
+    parser_network.add_argument('--scenarios', default=','.join(NETWORK_SCENARIOS), help="Comma-separated scenarios (%s)" % ', '.join(NETWORK_SCENARIOS))
+    parser_network.add_argument('--latency', type=float, default=MOCK_LATENCY, help="Latency of each response (milliseconds)")
+    parser_network.add_argument('--bandwidth', type=float, default=0, help="Bandwidth of each response (MB/s, 0 for unlimited)")
+    parser_network.add_argument('--error-rate', type=float, default=0, help="Fraction of requests answered with HTTP 503")
+    parser_network.add_argument('--games', type=int, default=MOCK_NUM_GAMES, help="Number of games")
+    parser_network.add_argument('--screenshots', type=int, default=MOCK_NUM_SCREENSHOTS, help="Number of screenshots")
+    parser_network.add_argument('--image-size', type=int, default=MOCK_IMAGE_SIZE, help="Size of each screenshot (bytes)")
+    parser_network.add_argument('-j', '--jobs', type=int, default=SteamTools.NUM_DOWNLOAD_JOBS, help="Number of parallel jobs")
+    parser_network.add_argument('--fixtures', default=None, help="Folder of recorded documents (%s)" % ', '.join(MOCK_FIXTURES.values()))
+    parser_network.add_argument('--seed', type=int, default=0, help="Random seed (for injected errors)")
+    parser_network.add_argument('--chunked', action='store_true', help="Send bodies with chunked transfer encoding")
+    parser_network.add_argument('--scenario', choices=NETWORK_SCENARIOS, default=None, help="Only run one scenario (in this process, against --url)")
+    parser_network.add_argument('--url', default=None, help="URL of a running mock server (with --scenario)")
+    args = parser.parse_args()
+    if args.benchmark == 'parsers':
+        bench_parsers(fixtures=args.fixtures, repeats=args.repeats)
+    elif args.benchmark == 'memory':
+        if args.mode is None:
+            bench_memory(num_games=args.games, num_achievements=args.achievements)
+        else:
+            measure_memory(args.mode, num_games=args.games, num_achievements=args.achievements)
+    elif args.benchmark == 'network':
+        if args.scenario is None:
+            bench_network(scenarios=args.scenarios.split(','), latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate, num_games=args.games, num_screenshots=args.screenshots, image_size=args.image_size, jobs=args.jobs, fixtures=args.fixtures, seed=args.seed, chunked=args.chunked)
+        else:
+            measure_network(args.scenario, args.url, num_games=args.games, num_screenshots=args.screenshots, jobs=args.jobs)
+    elif args.benchmark == 'importtime':
+        bench_importtime(repeats=args.repeats, max_ms=args.max_ms)
@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+'''
+SteamTools tests against a local mock Steam server (Niema Moshiri 2021)
+'''
+
+# imports
+from benchmark import MOCK_USERNAME, MockSteamServer, synthetic_games_xml, synthetic_profile_xml
+from unittest import TestCase, main
+import SteamTools
+
+# tests of the HTTP client
+class TestAsyncHTTPClient(TestCase):
+    # start a mock server (no latency, so the tests are fast) and a fresh client
+    def setUp(self):
+        self.server = MockSteamServer(latency=0, num_games=20, image_size=300000).start(); self.client = SteamTools.AsyncHTTPClient()
+
+    # stop the mock server
+    def tearDown(self):
+        self.server.shutdown(); self.server.server_close()
+
+    # get the body of a URL
+    def get(self, url):
+        return SteamTools.run_async(self.client.get(url))[0]
+
+    # sequential requests to one host share a single keep-alive connection
+    def test_keep_alive_reuse(self):
+        for _ in range(5):
+            self.assertEqual(self.get('%s/id/%s' % (self.server.url, MOCK_USERNAME)), synthetic_profile_xml(MOCK_USERNAME))
+        self.assertEqual(self.client.stats(), {'requests':5, 'connections_opened':1, 'connections_reused':4})
+        self.assertEqual(self.server.num_connections, 1)
+
+    # chunked bodies (larger than one chunk) are read completely, and the connection is still reused afterwards
+    def test_chunked_body(self):
+        self.server.chunked = True
+        self.assertEqual(self.get('%s/images/1.jpg' % self.server.url), self.server.image)
+        self.assertEqual(self.get('%s/id/%s/games?tab=all&xml=1' % (self.server.url, MOCK_USERNAME)), synthetic_games_xml(self.server.num_games))
+        self.assertEqual(self.client.stats()['connections_reused'], 1)
+        self.assertEqual(self.server.num_connections, 1)
+
+    # redirects are followed (on the same keep-alive connection)
+    def test_redirect(self):
+        self.assertEqual(self.get('%s/profiles/%s/games?tab=all&xml=1' % (self.server.url, MOCK_USERNAME)), synthetic_games_xml(self.server.num_games))
+        self.assertEqual(self.client.stats(), {'requests':2, 'connections_opened':1, 'connections_reused':1})
+
+    # plain HTTP requests go through the http_proxy (the mock server handles absolute URLs, so a second one acts as the proxy)
+    def test_http_proxy(self):
+        proxy = MockSteamServer(latency=0).start()
+        try:
+            self.client.proxies = {'http':proxy.url}
+            self.assertEqual(self.get('%s/id/%s' % (self.server.url, MOCK_USERNAME)), synthetic_profile_xml(MOCK_USERNAME))
+            self.assertEqual((proxy.num_requests, self.server.num_requests), (1, 0))
+        finally:
+            proxy.shutdown(); proxy.server_close()
+
+# run the tests
+if __name__ == "__main__":
+    main()